@@ -0,0 +1,84 @@
+"""Micro-benchmark for src.notes.parse against the old per-call-site parsing.
+
+Run from the repository root with:
+
+    python -m benchmarks.bench_notes [--projects N] [--lines N]
+"""
+
+import argparse
+import random
+import re
+import timeit
+
+import src.notes
+from benchmarks.fake_asana import INITIALS, synthetic_notes
+
+DOMAINS = ["mhs.com", "pearsonassessments.com"]
+
+
+def parse_old(notes: str):
+    """What go_through_by_color, what_to_do and mark_links used to do per project."""
+    lm_count = notes.lower().count(f"lm {INITIALS}")
+    lm_top = 0
+    for j, line in enumerate(notes.splitlines()):
+        if f"lm {INITIALS}" in line.lower():
+            lm_top = j + 1
+        else:
+            break
+    warning_on_top = (
+        f"lw {INITIALS}" in notes.splitlines()[0].lower() if notes else False
+    )
+    hold_match = re.search(r"hold\s+(\d{1,2}/\d{1,2})", notes)
+    hold = hold_match.group(1) if hold_match else None
+    # The old code also checked the first line for "hold", but never used the
+    # result, so it's left out here
+    open_links = [
+        link
+        for link in re.findall(r"(https?://\S+[\s\S]*?)(?=\n|$)", notes)
+        if " - DONE" not in link and any(domain in link for domain in DOMAINS)
+    ]
+    # what_to_do and mark_links ran the same findall again
+    re.findall(r"(https?://\S+[\s\S]*?)(?=\n|$)", notes)
+    return lm_count, lm_top, warning_on_top, hold, open_links
+
+
+def parse_new(notes: str):
+    state = src.notes.parse(notes, INITIALS, DOMAINS)
+    return (
+        state.lm_count,
+        state.lm_top,
+        state.warning_on_top,
+        state.hold,
+        state.open_links,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    corpus = [synthetic_notes(rng, args.lines) for _ in range(args.projects)]
+    size = sum(len(notes) for notes in corpus) / len(corpus)
+
+    for notes in corpus:
+        assert parse_old(notes) == parse_new(notes), notes
+
+    print(f"{args.projects} projects, {args.lines} lines, ~{size:.0f} chars each")
+    for label, parse in [("old", parse_old), ("new", parse_new)]:
+        best = min(
+            timeit.repeat(
+                lambda parse=parse: [parse(notes) for notes in corpus],
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        per_project = best / args.projects * 1e6
+        print(f"{label}: {best * 1000:.1f} ms total, {per_project:.1f} us/project")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end benchmarks for color runs, --batch, name searches and --done runs.
+
+Drives the real src.api / src.utils code against benchmarks.fake_asana with
+scripted operator input, and reports wall time, API calls and bytes moved.
+Run from the repository root with:
+
+    python -m benchmarks.bench_runs [--projects N] [--matching F] [--latency S]
+"""
+
+import argparse
+import builtins
+import contextlib
+import csv
+import io
+import itertools
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_asana import (
+    INITIALS,
+    MHS_HOST,
+    OTHER_LINE,
+    PEARSON_HOST,
+    FakeAsana,
+)
+
+
+def configure(fake: FakeAsana, cache_dir: str, cache_max_age: int):
+    os.environ.update(
+        ASANA_HOST=fake.url,
+        ASANA_TOKEN="benchmark",
+        ASANA_WORKSPACE_GID=fake.workspace,
+        ASANA_COLORS="light-blue",
+        USER_INITIALS=INITIALS,
+        ADMIN_MODE="False",
+        ASANA_CACHE_PATH=os.path.join(cache_dir, "projects.sqlite"),
+        ASANA_CACHE_MAX_AGE=str(cache_max_age),
+    )
+
+    import src.checkers
+    import src.config
+
+    src.checkers.checkers[MHS_HOST] = src.checkers.CompletionChecker(
+        "Thank you for completing"
+    )
+    src.checkers.checkers[PEARSON_HOST] = src.checkers.CompletionChecker(
+        "Test Completed!"
+    )
+    # get_consts only runs once per process, so the fake sites stay allowed
+    src.config.get_consts()
+    src.config.allowed_domains += [MHS_HOST, PEARSON_HOST]
+
+
+def write_batch(fake: FakeAsana, path: str):
+    """An "lm" for every project in the color, half of them given by name."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["project", "action", "argument"])
+        for i, project in enumerate(fake.projects.values()):
+            if project["color"] == "light-blue":
+                name = project["name"].split(" [")[0]
+                writer.writerow([name if i % 2 else project["gid"], "m", ""])
+
+
+def with_other_operator(fake: FakeAsana, run, think: float):
+    """Run run() while another operator goes through the same color.
+
+    Returns how many projects the other operator got.
+    """
+    import src.leases
+
+    handled = []
+
+    def work():
+        with src.leases.Leases() as leases:
+            for project in list(fake.projects.values()):
+                if project["color"] == "light-blue" and leases.claim(project["gid"]):
+                    # Reading and writing the project, and thinking about it
+                    time.sleep(think + 2 * fake.latency)
+                    leases.finish(project["gid"])
+                    handled.append(project["gid"])
+
+    other = threading.Thread(target=work)
+    other.start()
+    run()
+    other.join()
+    return len(handled)
+
+
+def two_notes():
+    """Add two notes to each project in the color, one write after the other."""
+    import src.cache
+    import src.utils
+
+    for data in src.cache.iter_projects(lambda p: p["color"] == "light-blue"):
+        for note in ["lm", "called back"]:
+            data["notes"] = src.utils.add_to_notes(
+                note, data["notes"], data["gid"], True
+            )
+
+
+def lost_updates(fake: FakeAsana) -> int:
+    """How many lines the other operator added were overwritten."""
+    return sum(OTHER_LINE not in fake.projects[gid]["notes"] for gid in fake.interfered)
+
+
+def measure(
+    fake: FakeAsana,
+    label: str,
+    run,
+    answers,
+    cold: bool = False,
+    recheck_links: bool = True,
+    think: float = 0,
+):
+    import src.cache
+    import src.config
+    import src.ratelimit
+
+    fake.reset()
+    # Scenarios check the questionnaires themselves, so they compare fairly,
+    # unless they're about a repeated run
+    if recheck_links:
+        src.cache.forget_link_checks()
+    if cold:
+        src.cache.clear()
+    fake.reset_counters()
+    src.ratelimit._scheduler = None
+
+    script = iter(answers)
+    first_prompt = []
+
+    def answer(prompt=""):
+        if not first_prompt:
+            first_prompt.append(time.perf_counter() - start)
+        time.sleep(think)
+        return next(script, "s")
+
+    builtins.input = answer
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run()
+    wall = time.perf_counter() - start
+
+    api_calls = sum(
+        count for route, count in fake.calls.items() if route != "questionnaire"
+    )
+    print(
+        f"{label:<28} {wall:8.2f} s {api_calls:6d} calls "
+        f"{fake.bytes_out / 1024:9.1f} KiB down {fake.bytes_in / 1024:7.1f} KiB up"
+    )
+    if first_prompt:
+        print(f"    first prompt after {first_prompt[0]:.2f} s")
+    for route, count in sorted(fake.calls.items()):
+        print(f"    {route:<32} {count}")
+    print(f"    {src.ratelimit.scheduler().summary()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=2000)
+    parser.add_argument(
+        "--matching", type=float, default=0.05, help="Share of projects in the color"
+    )
+    parser.add_argument("--lines", type=int, default=40, help="Lines of notes")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per Asana request"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Workers for --done")
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="Answer every Nth Asana request with a 429",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=int,
+        default=0,
+        help="ASANA_CACHE_MAX_AGE; 0 lists the workspace on every run",
+    )
+    args = parser.parse_args()
+
+    fake = FakeAsana(
+        args.projects,
+        args.matching,
+        args.lines,
+        args.latency,
+        throttle_every=args.throttle_every,
+    ).start()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        configure(fake, cache_dir, args.cache_max_age)
+
+        import src.api
+        import src.batch
+        import src.config
+        import src.utils
+
+        print(
+            f"{args.projects} projects, {args.matching:.0%} matching, "
+            f"{args.lines} lines of notes, {args.latency * 1000:.0f} ms latency\n"
+        )
+        color_run = src.api.go_through_by_color
+        measure(fake, "color run (cold cache)", color_run, itertools.repeat("m"), True)
+        measure(fake, "color run (warm cache)", color_run, itertools.repeat("m"))
+        fake.interfere = True
+        measure(
+            fake,
+            "color run (another operator)",
+            color_run,
+            itertools.repeat("m"),
+            True,
+        )
+        print(f"    {lost_updates(fake)} of {len(fake.interfered)} of their lines lost")
+        measure(fake, "two notes (another operator)", two_notes, [], True)
+        print(f"    {lost_updates(fake)} of {len(fake.interfered)} of their lines lost")
+        fake.interfere = False
+
+        # Operators taking 20 ms a project, sharing the list through leases
+        think = 0.02
+        src.config.LEASES_PATH = os.path.join(cache_dir, "leases.sqlite")
+        measure(
+            fake,
+            "color run (1 operator)",
+            color_run,
+            itertools.repeat("m"),
+            think=think,
+        )
+        os.remove(src.config.LEASES_PATH)
+        other = []
+        measure(
+            fake,
+            "color run (2 operators)",
+            lambda: other.append(with_other_operator(fake, color_run, think)),
+            itertools.repeat("m"),
+            think=think,
+        )
+        print(f"    the other operator went through {other[0]} projects")
+        src.config.LEASES_PATH = None
+        batch_path = os.path.join(cache_dir, "batch.csv")
+        write_batch(fake, batch_path)
+        measure(
+            fake, "--batch (lm for the color)", lambda: src.batch.run(batch_path), []
+        )
+        measure(
+            fake,
+            "search by name",
+            lambda: src.api.search_by_name("Client 1"),
+            ["1", "s"],
+        )
+        measure(
+            fake, "--done (1 worker)", lambda: src.utils.mark_done_links(workers=1), []
+        )
+        measure(
+            fake,
+            f"--done ({args.workers} workers)",
+            lambda: src.utils.mark_done_links(workers=args.workers),
+            [],
+        )
+        measure(
+            fake,
+            "--done (again, cached)",
+            lambda: src.utils.mark_done_links(workers=args.workers),
+            [],
+            recheck_links=False,
+        )
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark for the project name search index.
+
+Fills a throwaway project cache with synthetic names, then times building the
+index, updating it after a few renames, and ranked queries. Run from the
+repository root with:
+
+    python -m benchmarks.bench_search [--projects N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+FIRST = ["Ava", "Liam", "Noah", "Emma", "Mia", "Lucas", "Amelia", "Ethan", "Zoe"]
+LAST = ["Smith", "Johnson", "Nguyen", "Garcia", "Brown", "O'Connor", "Patel", "Kim"]
+TAGS = ["[ASD]", "[ADHD]", "[ASD] [ADHD]", "{intake}", "{records}", ""]
+
+
+def synthetic_name(rng: random.Random, i: int) -> str:
+    return (
+        f"{rng.choice(FIRST)} {rng.choice(LAST)}{rng.randint(1, 999)} "
+        f"{rng.choice(TAGS)} #{i}"
+    )
+
+
+def timed(label: str, run, repeat: int = 1):
+    best = min(_time(run) for _ in range(repeat))
+    print(f"{label:<36} {best * 1000:9.2f} ms")
+
+
+def _time(run) -> float:
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ.update(
+            ASANA_TOKEN="benchmark",
+            ASANA_WORKSPACE_GID="1000",
+            USER_INITIALS="js",
+            ASANA_CACHE_PATH=os.path.join(cache_dir, "projects.sqlite"),
+            ASANA_CACHE_MAX_AGE=str(10**9),
+        )
+        import src.cache
+        import src.config
+        import src.search
+
+        src.config.get_consts()
+        db = src.cache.connect()
+        rng = random.Random(0)
+        with db:
+            db.executemany(
+                "INSERT INTO projects (gid, workspace, name, color) VALUES (?, ?, ?, ?)",
+                (
+                    (str(i), "1000", synthetic_name(rng, i), "light-blue")
+                    for i in range(args.projects)
+                ),
+            )
+            # Counts as freshly listed, so searches don't go to Asana
+            db.execute(
+                "INSERT INTO syncs (workspace, synced_at) VALUES (?, ?)",
+                ("1000", time.time()),
+            )
+
+        print(f"{args.projects} projects")
+        with db:
+            timed("build index", lambda: src.cache._index_names(db))
+        with db:
+            for gid in rng.sample(range(args.projects), 10):
+                db.execute(
+                    "UPDATE projects SET name = ? WHERE gid = ?",
+                    (synthetic_name(rng, gid), str(gid)),
+                )
+            timed("update index after 10 renames", lambda: src.cache._index_names(db))
+
+        for query in ["Emma Nguyen", "emma ngyuen", "oconnor", "Zoe Kim42", "Li"]:
+            results = src.search.search(query)
+            top = results[0]["name"] if results else "-"
+            timed(
+                f"search {query!r}",
+                lambda query=query: src.search.search(query),
+                args.repeat,
+            )
+            print(f"    {len(results)} results, top: {top}")
+
+
+if __name__ == "__main__":
+    main()
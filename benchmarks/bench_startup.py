@@ -0,0 +1,68 @@
+"""Startup-time check for main.py.
+
+Runs `python -X importtime main.py --help` and reports how long imports took,
+failing if a module only some commands need got imported, or if startup goes
+over budget. Run from the repository root with:
+
+    python -m benchmarks.bench_startup [--budget MS] [--repeat N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Only the commands that talk to Asana or open a browser need these
+HEAVY_MODULES = [
+    "asana",
+    "colored",
+    "dateutil",
+    "keyring",
+    "selenium",
+    "src.api",
+    "src.utils",
+    "urllib3",
+]
+
+
+def import_times(args: list[str]) -> dict[str, int]:
+    """Cumulative import time in microseconds of every module main.py loads."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "main.py", *args],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "ADMIN_MODE": "False"},
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=150, help="Milliseconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [import_times(["--help"]) for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: sum(times.values()))
+
+    loaded = [name for name in HEAVY_MODULES if name in best]
+    top = sorted(best.items(), key=lambda item: item[1], reverse=True)
+    total = best.get("src.config", 0) / 1000
+    print(f"main.py --help: src.config took {total:.1f} ms to import")
+    for name, cumulative in top[:8]:
+        print(f"    {name:<32} {cumulative / 1000:7.1f} ms")
+
+    if loaded:
+        sys.exit(f"--help imported {', '.join(loaded)}")
+    if total > args.budget:
+        sys.exit(f"--help startup over budget: {total:.1f} > {args.budget:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""A local stand-in for the parts of Asana (and MHS/Pearson) this tool uses.
+
+FakeAsana serves the project endpoints the asana client calls, plus canned
+questionnaire pages, and counts every request and byte that goes through it.
+"""
+
+import copy
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Questionnaire pages are served under these hosts, which both resolve to the
+# local server, so each can get its own completion checker.
+MHS_HOST = "127.0.0.1"
+PEARSON_HOST = "localhost"
+
+INITIALS = "js"
+# What the other operator adds when FakeAsana.interfere is set
+OTHER_LINE = "10/18 called mom ab"
+
+PAGES = {
+    "mhs-done": "<html><body><h1>Thank you for completing the survey</h1></body></html>",
+    "mhs-open": "<html><body><form><h1>Rating Scale</h1></form></body></html>",
+    "pearson-done": "<html><body><div>Test Completed!</div></body></html>",
+    "pearson-open": "<html><body><div>Begin Assessment</div></body></html>",
+}
+
+
+def synthetic_notes(
+    rng: random.Random,
+    lines: int,
+    hosts: list[str] = [
+        "assess.mhs.com",
+        "qglobal.pearsonassessments.com",
+        "example.com",
+    ],
+) -> str:
+    """Notes shaped like the real ones: dated lines, holds and links."""
+    out = []
+    for i in range(lines):
+        date = f"{rng.randint(1, 12):02}/{rng.randint(1, 28):02}"
+        kind = rng.random()
+        if i < 3 and kind < 0.5:
+            out.append(f"{date} lm {INITIALS}")
+        elif kind < 0.1:
+            out.append(f"{date} hold {date} {INITIALS}")
+        elif kind < 0.25 and hosts:
+            domain = rng.choice(hosts)
+            done = " - DONE" if rng.random() < 0.5 else ""
+            out.append(
+                f"https://{domain}/q/{rng.getrandbits(64):x} - Self-Report - {INITIALS}{done}"
+            )
+        else:
+            words = " ".join(
+                rng.choice(
+                    ["called", "mom", "left", "vm", "scheduled", "eval", "intake"]
+                )
+                for _ in range(rng.randint(4, 14))
+            )
+            out.append(f"{date} {words} {INITIALS}")
+    return "\n".join(out)
+
+
+class FakeAsana:
+    def __init__(
+        self,
+        projects: int = 2000,
+        matching: float = 0.05,
+        lines: int = 40,
+        latency: float = 0.05,
+        color: str = "light-blue",
+        seed: int = 0,
+        throttle_every: int = 0,
+    ):
+        self.latency = latency
+        # Every this many Asana requests is answered with a 429
+        self.throttle_every = throttle_every
+        # When set, another operator adds a line to each project right after
+        # its notes are first read, as if working the same color
+        self.interfere = False
+        self.interfered = set()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.workspace = "1000"
+        self.projects = {}
+        rng = random.Random(seed)
+        for i in range(projects):
+            gid = str(2000 + i)
+            notes = synthetic_notes(rng, lines, hosts=[])
+            if rng.random() < matching:
+                project_color = color
+                host, kind = rng.choice([(MHS_HOST, "mhs"), (PEARSON_HOST, "pearson")])
+                state = rng.choice(["done", "open"])
+                notes = f"http://{host}:{{port}}/q/{kind}-{state}/{gid} - Parent/Guardian - {INITIALS}\n{notes}"
+            else:
+                project_color = rng.choice(["dark-pink", "light-purple", "none"])
+            self.projects[gid] = {
+                "gid": gid,
+                "resource_type": "project",
+                "name": f"Client {i} [ASD] {{intake}}",
+                "color": project_color,
+                "permalink_url": f"https://app.asana.com/0/{gid}",
+                "notes": notes,
+                "modified_at": datetime(2024, 1, 1).isoformat() + "Z",
+            }
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.port = self.server.server_address[1]
+        for project in self.projects.values():
+            project["notes"] = project["notes"].replace("{port}", str(self.port))
+        self._initial = copy.deepcopy(self.projects)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def reset(self):
+        """Undo every change made to the projects since the server started."""
+        with self.lock:
+            self.projects = copy.deepcopy(self._initial)
+            self.interfered = set()
+        self.reset_counters()
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def touch(self, gid: str, **fields):
+        """Change a project the way another operator would."""
+        with self.lock:
+            self.projects[gid].update(fields)
+            self.projects[gid]["modified_at"] = datetime.now().isoformat() + "Z"
+
+    def _fields(self, project, opt_fields):
+        fields = ["gid"] + [f.strip() for f in opt_fields.split(",") if f.strip()]
+        return {field: project.get(field) for field in fields}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, content_type="application/json"):
+                body = (
+                    payload.encode()
+                    if isinstance(payload, str)
+                    else json.dumps(payload).encode()
+                )
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with fake.lock:
+                    fake.bytes_out += len(body)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                with fake.lock:
+                    fake.bytes_in += length
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _count(self, route):
+                with fake.lock:
+                    fake.calls[route] += 1
+
+            def _throttled(self):
+                with fake.lock:
+                    fake.requests += 1
+                    throttled = (
+                        fake.throttle_every and fake.requests % fake.throttle_every == 0
+                    )
+                if throttled:
+                    self._count("429")
+                    self.send_response(429)
+                    self.send_header("Retry-After", "1")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                return throttled
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                parts = url.path.strip("/").split("/")
+                if parts[0] == "q":
+                    self._count("questionnaire")
+                    return self._send(200, PAGES[parts[1]], "text/html")
+                time.sleep(fake.latency)
+                if self._throttled():
+                    return
+                if parts[-1] == "projects" and parts[-3] == "workspaces":
+                    self._count("GET /workspaces/{gid}/projects")
+                    limit = int(query.get("limit", 100))
+                    offset = int(query.get("offset", 0))
+                    with fake.lock:
+                        projects = list(fake.projects.values())
+                    page = projects[offset : offset + limit]
+                    next_offset = offset + limit
+                    return self._send(
+                        200,
+                        {
+                            "data": [
+                                fake._fields(p, query.get("opt_fields", "name"))
+                                for p in page
+                            ],
+                            "next_page": {"offset": str(next_offset)}
+                            if next_offset < len(projects)
+                            else None,
+                        },
+                    )
+                if parts[-2] == "projects":
+                    self._count("GET /projects/{gid}")
+                    project = fake.projects.get(parts[-1])
+                    if project is None:
+                        return self._send(404, {"errors": [{"message": "Not found"}]})
+                    opt_fields = query.get("opt_fields", "")
+                    self._send(200, {"data": fake._fields(project, opt_fields)})
+                    with fake.lock:
+                        interfere = (
+                            fake.interfere
+                            and "notes" in opt_fields
+                            and project["gid"] not in fake.interfered
+                        )
+                        fake.interfered.add(project["gid"])
+                    if interfere:
+                        fake.touch(
+                            project["gid"], notes=f"{OTHER_LINE}\n{project['notes']}"
+                        )
+                    return
+                self._send(404, {"errors": [{"message": "Unknown route"}]})
+
+            def do_PUT(self):
+                time.sleep(fake.latency)
+                if self._throttled():
+                    return
+                self._count("PUT /projects/{gid}")
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                gid = url.path.strip("/").split("/")[-1]
+                fake.touch(gid, **self._body()["data"])
+                opt_fields = query.get("opt_fields", "name")
+                self._send(200, {"data": fake._fields(fake.projects[gid], opt_fields)})
+
+            def do_POST(self):
+                time.sleep(fake.latency)
+                if self._throttled():
+                    return
+                self._count("POST /batch")
+                results = []
+                for action in self._body()["data"]["actions"]:
+                    gid = action["relative_path"].strip("/").split("/")[-1]
+                    fake.touch(gid, **action["data"])
+                    opt_fields = ",".join(action.get("options", {}).get("fields", []))
+                    results.append(
+                        {
+                            "status_code": 200,
+                            "body": {
+                                "data": fake._fields(
+                                    fake.projects[gid], opt_fields or "name"
+                                )
+                            },
+                        }
+                    )
+                self._send(200, {"data": results})
+
+        return Handler
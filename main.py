@@ -1,10 +1,57 @@
 import argparse
+import sys
 
-import keyring
-
-import src.api
 import src.config
-import src.utils
+import src.timing
+
+# Each command imports what it needs (asana, selenium, ...) only once it's
+# chosen, so --help and --reset start quickly.
+
+
+def run(args):
+    if args.expired:
+        from src import api
+
+        api.go_through_by_color(expired=True)
+    elif args.done:
+        from src import utils
+
+        utils.mark_done_links(workers=args.workers)
+    elif args.generate is not None:
+        from src import questionnaires
+
+        questionnaires.generate(
+            csv_path=args.generate or None,
+            colors=[args.color] if args.color else None,
+        )
+    elif args.batch:
+        from src import batch
+
+        batch.run(args.batch)
+    elif args.reset:
+        src.config.reset(args.reset)
+    elif args.color:
+        from src import api
+
+        api.go_through_by_color(colors=[args.color])
+    elif args.search:
+        from src import api
+
+        api.search_by_name(args.search)
+    else:
+        from src import api
+
+        if src.config.ADMIN_MODE:
+            print("s <term>".ljust(10) + "Search by name")
+            print("c ".ljust(10) + "Go through color(s)")
+            choice = src.timing.prompt("Choose: ")
+            if choice.startswith("s "):
+                api.search_by_name(choice[2:].strip())
+            elif choice == "c":
+                api.go_through_by_color(["light-blue"])
+        else:
+            api.go_through_by_color()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -22,6 +69,33 @@ if __name__ == "__main__":
         action="store_true",
         help="Mark links as done" if not src.config.ADMIN_MODE else argparse.SUPPRESS,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="How many links to check at once with --done, up to a few for each site"
+        if not src.config.ADMIN_MODE
+        else argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        "-g",
+        "--generate",
+        nargs="?",
+        const="",
+        metavar="CSV",
+        help="Generate and send ASRS/Conners links for the clients in CSV, or in the color from -c"
+        if not src.config.ADMIN_MODE
+        else argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        metavar="FILE",
+        help="Apply the actions in a CSV or JSONL file of project, action and argument "
+        + ("(a or h)" if src.config.ADMIN_MODE else "(a, h, m, w or qs)")
+        + " without prompting",
+    )
     parser.add_argument(
         "-e",
         "--expired",
@@ -33,30 +107,29 @@ if __name__ == "__main__":
         "--reset",
         nargs="?",
         const="all",
-        help=argparse.SUPPRESS
-        if not any(keyring.get_password("asana", key) for key in ["token", "initials"])
-        else "Reset stored token and initials. Choose 'token', 'initials', or leave blank for all",
+        help="Reset stored token and initials. Choose 'token', 'initials', or leave blank for all",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="TRACE",
+        help="Print where the run spent its time, and write a Chrome trace (JSON) to TRACE if given",
     )
     args = parser.parse_args()
 
-    if args.expired:
-        src.api.go_through_by_color(expired=True)
-    elif args.done:
-        src.utils.mark_done_links()
-    elif args.reset:
-        src.config.reset(args.reset)
-    elif args.color:
-        src.api.go_through_by_color(colors=[args.color])
-    elif args.search:
-        src.api.search_by_name(args.search)
-    else:
-        if src.config.ADMIN_MODE:
-            print("s <term>".ljust(10) + "Search by name")
-            print("c ".ljust(10) + "Go through color(s)")
-            choice = input("Choose: ")
-            if choice.startswith("s "):
-                src.api.search_by_name(choice[2:].strip())
-            elif choice == "c":
-                src.api.go_through_by_color(["light-blue"])
-        else:
-            src.api.go_through_by_color()
+    if args.profile is not None:
+        src.timing.enable()
+    try:
+        run(args)
+    finally:
+        if args.profile is not None:
+            print(src.timing.summary())
+            # Only commands that talked to Asana have requests to report
+            ratelimit = sys.modules.get("src.ratelimit")
+            if ratelimit is not None:
+                print(ratelimit.scheduler().summary())
+            if args.profile:
+                src.timing.write_trace(args.profile)
+                print(f"Wrote trace to {args.profile}")
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+
+from asana.rest import ApiException
+
+import src.api
+import src.cache
+import src.config
+import src.ratelimit
+import src.search
+import src.updates
+
+# The generated asana client is blocking, so calls run on worker threads that
+# share its connection pool, and go through src.ratelimit. The event loop itself lives on a background
+# thread so the interactive code can keep running while requests are in flight.
+_loop = None
+_loop_lock = threading.Lock()
+_project_locks = defaultdict(asyncio.Lock)
+_pipeline = None
+
+# How many single-project requests may be in flight at once
+FETCH_CONCURRENCY = 10
+
+
+def loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+    return _loop
+
+
+def submit(coro) -> Future:
+    return asyncio.run_coroutine_threadsafe(coro, loop())
+
+
+def run(coro):
+    return submit(coro).result()
+
+
+def iterate(agen):
+    """Consume an async generator from synchronous code."""
+    while True:
+        try:
+            yield run(agen.__anext__())
+        except StopAsyncIteration:
+            return
+
+
+class WritePipeline:
+    """While active, project updates are sent in the background.
+
+    Updates to the same project are still applied in the order they were
+    made. Leaving the block waits for everything still in flight.
+    """
+
+    def __init__(self):
+        self.pending: list[Future] = []
+
+    def __enter__(self):
+        global _pipeline
+        _pipeline = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _pipeline
+        _pipeline = None
+        for future in self.pending:
+            future.result()
+
+
+def dispatch(coro):
+    """Run coro, or queue it on the active WritePipeline."""
+    if _pipeline is None:
+        return run(coro)
+    _pipeline.pending.append(submit(coro))
+
+
+async def _get_projects_page(opts):
+    return await asyncio.to_thread(
+        src.ratelimit.call,
+        src.config.projects_api_instance.get_projects_for_workspace,
+        src.config.WORKSPACE_GID,
+        opts,
+        full_payload=True,
+    )
+
+
+async def list_project_pages(opt_fields):
+    """Yield every unarchived project a page at a time, fetching the next in advance."""
+    opts = {"limit": 100, "archived": False, "opt_fields": opt_fields}
+    next_page = asyncio.ensure_future(_get_projects_page(dict(opts)))
+    while next_page is not None:
+        page = await next_page
+        offset = (page.get("next_page") or {}).get("offset")
+        next_page = (
+            asyncio.ensure_future(_get_projects_page({**opts, "offset": offset}))
+            if offset
+            else None
+        )
+        yield page["data"]
+
+
+async def get_projects(gids, opt_fields):
+    """Fetch several projects in parallel; deleted ones come back as None."""
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def get_project(gid):
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(
+                    src.ratelimit.call,
+                    src.config.projects_api_instance.get_project,
+                    gid,
+                    {"opt_fields": opt_fields},
+                )
+            except ApiException as e:
+                if e.status == 404:
+                    return None
+                raise
+
+    return await asyncio.gather(*(get_project(gid) for gid in gids))
+
+
+async def get_asana_tasks_by_color(colors=None):
+    src.config.get_consts()
+    if colors is None:
+        colors = src.config.ASANA_COLORS
+    return await asyncio.to_thread(
+        src.cache.get_projects, lambda project: project["color"] in colors
+    )
+
+
+async def find_projects_by_name(name, left_out=None):
+    src.config.get_consts()
+    return await asyncio.to_thread(src.search.search, name, True, left_out)
+
+
+async def get_project(gid):
+    src.config.get_consts()
+    return await asyncio.to_thread(src.cache.get_project, gid)
+
+
+async def update_project(project_gid, fields):
+    async with _project_locks[project_gid]:
+        try:
+            fields = dict(fields)
+            conflicted = bool(await src.updates.reconcile({project_gid: fields}))
+            if not fields:
+                return False
+            api_response = await asyncio.to_thread(
+                src.ratelimit.call,
+                src.config.projects_api_instance.update_project,
+                {"data": fields},
+                project_gid,
+                opts={"opt_fields": ",".join(src.updates.RESPONSE_FIELDS)},
+            )
+            await asyncio.to_thread(src.cache.invalidate, project_gid)
+            src.updates.wrote(project_gid, fields, api_response)
+            src.api.report_update(api_response, fields)
+            return not conflicted
+        except ApiException as e:
+            print("Exception when calling ProjectsApi->update_project:: %s\n" % e)
+            return False
+
+
+async def replace_notes(new_text, project_gid):
+    await update_project(project_gid, {"notes": new_text})
+
+
+async def change_color(color, project_gid):
+    await update_project(project_gid, {"color": color})
@@ -4,159 +4,201 @@ from datetime import datetime, timedelta
 
 from asana.rest import ApiException
 
+import src.aio
+import src.cache
+import src.checkers
 import src.config
+import src.leases
+import src.notes
+import src.search
+import src.timing
 import src.utils
 
 
 def get_asana_tasks_by_color(colors=None, expired=False):
     src.config.get_consts()
-    if colors is None:
-        colors = src.config.ASANA_COLORS
-    opts = {
-        "limit": 100,
-        "archived": False,
-        "opt_fields": "name,color,permalink_url,notes",
-    }
-    try:
-        print("Fetching projects...")
-
-        api_response = list(
-            src.config.projects_api_instance.get_projects_for_workspace(
-                src.config.WORKSPACE_GID,
-                opts,  # pyright: ignore (asana api is strange)
-            )
-        )
+    print("Fetching projects...")
+    return src.aio.run(src.aio.get_asana_tasks_by_color(colors))
 
-    except ApiException as e:
-        print(
-            "Exception when calling ProjectsApi->get_projects_for_workspace: %s\n" % e
-        )
-        return
 
-    if api_response:
-        filtered_projects = [data for data in api_response if data["color"] in colors]
-        return filtered_projects
+def iter_tasks_by_color(colors=None):
+    """Yield the projects in the given colors as each page of them is ready."""
+    src.config.get_consts()
+    if colors is None:
+        colors = src.config.ASANA_COLORS
+    print("Fetching projects...")
+    return src.cache.iter_projects(lambda project: project["color"] in colors)
+
+
+NAME_TAGS = re.compile(r"\[.*?\]|\{.*?\}|[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+DIAGNOSES = re.compile(r"(ASD|ADHD)")
+
+# How many projects are prepared (links checked) ahead of the one on screen
+PREFETCH_PROJECTS = 3
+
+
+def prepare_project(data, expired=False, link_checker=None):
+    """Work out everything about a project that doesn't need the operator.
+
+    Sets data["skip"] to the reason the project should be skipped, if any, and
+    queues its open questionnaire links on link_checker.
+    """
+    if not src.config.ADMIN_MODE:
+        data["name"] = NAME_TAGS.sub("", data["name"])
+    data["name"] = WHITESPACE.sub(" ", data["name"]).strip()
+    state = src.notes.state_of(data)
+    data["messages_sent"] = state.lm_count
+    data["messages_sent_top"] = state.lm_top
+    data["warning_on_top"] = state.warning_on_top
+    data["hold"] = state.hold
+    data["skip"] = None
+    data["link_checks"] = None
+
+    if expired:
+        data["name"] = DIAGNOSES.sub("", data["name"])
+        data["name"] = WHITESPACE.sub(" ", data["name"]).strip()
+        return data
+
+    if data["hold"]:
+        current_month = datetime.now().month
+        year = datetime.now().year
+        if current_month in [1, 2] and data["hold"] not in ["01", "02"]:
+            year -= 1
+        hold_date = datetime.strptime(f"{data['hold']}/{year}", "%m/%d/%Y")
+        if hold_date > datetime.now():
+            data["skip"] = f"Skipping {data['name']}, on hold until {data['hold']}."
+            return data
+    if not src.config.ADMIN_MODE:
+        if data["notes"] and (
+            datetime.now().strftime("%m/%d") in state.first_line
+            or (datetime.now() - timedelta(days=1)).strftime("%m/%d")
+            in state.first_line
+            and "hold" not in state.first_line.lower()
+        ):
+            data["skip"] = f"Skipping {data['name']}, already noted today or yesterday."
+            return data
+        if link_checker is not None:
+            data["link_checks"] = {
+                link: link_checker.submit(link) for link in state.open_links
+            }
+    return data
+
+
+def without_warnings(projects, left_out: list[str]):
+    """The projects with notes and no warning on top.
+
+    The names of the others are added to left_out.
+    """
+    for data in projects:
+        if data["notes"] and not src.notes.state_of(data).warning_on_top:
+            yield data
+        else:
+            left_out.append(data["name"])
 
 
 def go_through_by_color(colors=None, expired=False):
-    filtered_projects = get_asana_tasks_by_color()
+    # Projects are shown as soon as their page of the listing is in, so how
+    # many there are is only known at the end
+    filtered_projects = iter_tasks_by_color(colors)
+    left_out = []
+    if not expired and not src.config.ADMIN_MODE:
+        filtered_projects = without_warnings(filtered_projects, left_out)
+
+    project_count = 0
+    # Links of the next few projects are checked while the operator is still
+    # working on the current one. A single checker keeps it to one browser.
+    with (
+        src.checkers.LinkChecker() as link_checker,
+        src.aio.WritePipeline(),
+        src.leases.Leases() as leases,
+    ):
+        if not expired:
+            # Other operators going through the same colors get other projects
+            filtered_projects = leases.claimed(filtered_projects)
+        prepared = src.utils.prefetch(
+            filtered_projects,
+            lambda data: prepare_project(data, expired, link_checker),
+            PREFETCH_PROJECTS,
+        )
+        try:
+            for project_count, data in enumerate(prepared, 1):
+                leases.renew()
+                if data["skip"]:
+                    print(data["skip"])
+                elif expired:
+                    src.utils.get_expired(data)
+                else:
+                    src.utils.what_to_do(
+                        data,
+                        count=[project_count],
+                        source="colors",
+                        link_checker=link_checker,
+                        link_checks=data["link_checks"],
+                    )
+                leases.finish(data["gid"])
+        except ApiException as e:
+            print("Exception when fetching projects: %s\n" % e)
+            print(
+                f"Stopped after {project_count} projects, "
+                "as the rest of the list couldn't be fetched."
+            )
+            return
 
-    if not filtered_projects:
+    if not project_count and not left_out and not leases.taken:
         print("No projects found.")
         return
-
-    project_count = len(filtered_projects)
-
     if project_count == 1:
-        print("Found 1 project.")
+        print("Went through 1 project.")
     else:
-        print(f"Found {project_count} projects.")
-
-    if not expired and not src.config.ADMIN_MODE:
-        filtered_projects = [
-            data
-            for data in filtered_projects
-            if data["notes"]
-            and f"lw {src.config.INITIALS}" not in data["notes"].splitlines()[0].lower()
-        ]
-        project_count = len(filtered_projects)
-        print(
-            f"Removed projects with warnings on top. New project count: {project_count}"
-        )
-
-    for i, data in enumerate(filtered_projects, 1):
-        if not src.config.ADMIN_MODE:
-            data["name"] = re.sub(r"\[.*?\]|\{.*?\}|[^\w\s]", "", data["name"])
-        data["name"] = re.sub(r"\s+", " ", data["name"]).strip()
-        data["messages_sent"] = data["notes"].lower().count(f"lm {src.config.INITIALS}")
-        data["messages_sent_top"] = 0
-        lines = data["notes"].splitlines()
-        for j, line in enumerate(lines):
-            if f"lm {src.config.INITIALS}" in line.lower():
-                data["messages_sent_top"] = j + 1
-            else:
-                break
-        data["warning_on_top"] = (
-            f"lw {src.config.INITIALS}" in data["notes"].splitlines()[0].lower()
-            if data["notes"]
-            else False
-        )
-        hold_match = re.search(r"hold\s+(\d{1,2}/\d{1,2})", data["notes"])
-        data["hold"] = hold_match.group(1) if hold_match else None
-
-        if expired:
-            data["name"] = re.sub(r"(ASD|ADHD)", "", data["name"])
-            data["name"] = re.sub(r"\s+", " ", data["name"]).strip()
-            src.utils.get_expired(data)
-        else:
-            if data["hold"]:
-                current_month = datetime.now().month
-                year = datetime.now().year
-                if current_month in [1, 2] and data["hold"] not in ["01", "02"]:
-                    year -= 1
-                hold_date = datetime.strptime(f"{data['hold']}/{year}", "%m/%d/%Y")
-                if hold_date > datetime.now():
-                    print(f"Skipping {data['name']}, on hold until {data['hold']}.")
-                    continue
-            if not src.config.ADMIN_MODE:
-                if data["notes"] and (
-                    datetime.now().strftime("%m/%d") in data["notes"].splitlines()[0]
-                    or (datetime.now() - timedelta(days=1)).strftime("%m/%d")
-                    in data["notes"].splitlines()[0]
-                    and "hold" not in data["notes"].splitlines()[0].lower()
-                ):
-                    print(f"Skipping {data['name']}, already noted today or yesterday.")
-                    continue
-
-            src.utils.what_to_do(data, count=[i, project_count], source="colors")
+        print(f"Went through {project_count} projects.")
+    if left_out:
+        print(f"Left out {len(left_out)} projects with warnings on top.")
+    if leases.taken:
+        print(f"Left {leases.taken} projects to other operators.")
 
     if sys.platform != "linux":
-        input("End of list! You can close this window now.")
+        src.timing.prompt("End of list! You can close this window now.")
 
 
 def search_by_name(name):
     src.config.get_consts()
-    opts = {
-        "limit": 100,
-        "archived": False,
-        "opt_fields": "name,color,permalink_url,notes",
-    }
-    try:
-        print(f"Searching projects for {name}...")
-
-        api_response = list(
-            src.config.projects_api_instance.get_projects_for_workspace(
-                src.config.WORKSPACE_GID,
-                opts,  # pyright: ignore (asana api is strange)
-            )
-        )
-
-    except ApiException as e:
+    print(f"Searching projects for {name}...")
+    left_out = []
+    filtered_projects = src.aio.run(src.aio.find_projects_by_name(name, left_out))
+    if left_out:
         print(
-            "Exception when calling ProjectsApi->get_projects_for_workspace: %s\n" % e
+            f"Not showing {len(left_out)} more projects with similar names. "
+            "Search for more of the name to narrow it down."
         )
-        return
 
-    if api_response:
-        filtered_projects = [
-            data for data in api_response if name.lower() in data["name"].lower()
-        ]
+    if filtered_projects is not None:
         project_count = len(filtered_projects)
+        # Only a project whose name contains the search is surely the one
+        query = src.search.normalize(name)
+        exact = project_count == 1 and query in src.search.normalize(
+            filtered_projects[0]["name"]
+        )
 
         correct_project = None
 
         if project_count == 0:
-            input("No projects found.")
-        elif project_count == 1:
+            src.timing.prompt("No projects found.")
+        elif exact:
             print("Found 1 project.")
             correct_project = filtered_projects[0]
         else:
-            print(f"Found {project_count} projects.")
+            # A single project that's only like the name may be someone else's
+            print(
+                "Found 1 project."
+                if project_count == 1
+                else f"Found {project_count} projects."
+            )
             for i, data in enumerate(filtered_projects, 1):
-                data["name"] = re.sub(r"\s+", " ", data["name"]).strip()
+                data["name"] = WHITESPACE.sub(" ", data["name"]).strip()
                 src.utils.print_project(data, count=[i, project_count], fields=["name"])
             while True:
-                choice = input(
+                choice = src.timing.prompt(
                     f"Enter the number of the correct project (1-{project_count}): "
                 )
                 try:
@@ -164,34 +206,35 @@ def search_by_name(name):
                     break
                 except (ValueError, IndexError):
                     print("Invalid input.")
+        if correct_project:
+            # The search only has names, the rest is fetched for the chosen one
+            correct_project = src.aio.run(src.aio.get_project(correct_project["gid"]))
         if correct_project:
             print("\n")
             src.utils.what_to_do(correct_project, source="search")
 
 
-def replace_notes(new_text, project_gid):
-    body = {"data": {"notes": new_text}}
-    try:
-        api_response = src.config.projects_api_instance.update_project(
-            body, project_gid, opts={"opt_fields": "name, notes"}
-        )
-        if isinstance(api_response, dict) and "name" in api_response:
-            print(f"Added note to {api_response['name'].strip()}.")
-        else:
-            print("Added note to project")
-    except ApiException as e:
-        print("Exception when calling ProjectsApi->update_project:: %s\n" % e)
+def update_project(project_gid, fields):
+    return src.aio.dispatch(src.aio.update_project(project_gid, fields))
 
 
-def change_color(color, project_gid):
-    body = {"data": {"color": color}}
-    try:
-        api_response = src.config.projects_api_instance.update_project(
-            body, project_gid, opts={"opt_fields": "name, color"}
-        )
-        if isinstance(api_response, dict) and "name" in api_response:
-            print(f"Changed color of {api_response['name'].strip()} to {color}.")
+def report_update(api_response, fields):
+    name = None
+    if isinstance(api_response, dict) and "name" in api_response:
+        name = api_response["name"].strip()
+    if "notes" in fields:
+        print(f"Added note to {name}." if name else "Added note to project")
+    if "color" in fields:
+        color = fields["color"]
+        if name:
+            print(f"Changed color of {name} to {color}.")
         else:
             print(f"Changed project color to {color}.")
-    except ApiException as e:
-        print("Exception when calling ProjectsApi->update_project:: %s\n" % e)
+
+
+def replace_notes(new_text, project_gid):
+    update_project(project_gid, {"notes": new_text})
+
+
+def change_color(color, project_gid):
+    update_project(project_gid, {"color": color})
@@ -0,0 +1,195 @@
+import csv
+import json
+
+import src.aio
+import src.config
+import src.search
+import src.updates
+import src.utils
+
+# What each action's argument is, for actions that need one
+ACTIONS = {
+    "a": "a note",
+    "h": "a number of days or a MM/DD date",
+    "qs": "the self-report link and the parent/guardian link",
+    "m": None,
+    "w": None,
+}
+# What admin mode can do, as in what_to_do
+ADMIN_ACTIONS = {"a", "h"}
+
+
+def read_rows(path: str) -> tuple[list[dict], list[tuple[dict, str]]]:
+    """Rows of project, action and argument from a CSV or JSONL file.
+
+    project is a project's gid, or its name as the color run shows it. Each
+    row keeps the line it was on, to point at in errors. Lines that can't be
+    read as a row are returned separately, along with why.
+    """
+    rows = []
+    failed = []
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".json")):
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    failed.append((_row(line_number, {}), f"invalid JSON ({e.msg})"))
+                    continue
+                if not isinstance(row, dict):
+                    failed.append((_row(line_number, {}), "not a JSON object"))
+                    continue
+                rows.append(_row(line_number, row))
+        else:
+            rows = [
+                _row(line_number, row)
+                for line_number, row in enumerate(csv.DictReader(f), 2)
+            ]
+    return rows, failed
+
+
+def _row(line_number: int, row: dict) -> dict:
+    return {
+        "line": line_number,
+        "project": str(row.get("project") or "").strip(),
+        "action": str(row.get("action") or "").strip().lower(),
+        "argument": str(row.get("argument") or "").strip(),
+    }
+
+
+def check_action(row: dict) -> str | None:
+    """Why the row's action can't be done, if it can't."""
+    action, argument = row["action"], row["argument"]
+    if action not in ACTIONS or (src.config.ADMIN_MODE and action not in ADMIN_ACTIONS):
+        return f"unknown action {action!r}"
+    if ACTIONS[action] and not argument:
+        return f"{action} needs {ACTIONS[action]}"
+    if action == "h" and src.utils.hold_date(argument) is None:
+        return f"h needs {ACTIONS['h']}, not {argument!r}"
+    if action == "qs" and len(argument.split()) != 2:
+        return f"qs needs {ACTIONS['qs']}, separated by a space"
+    return None
+
+
+def find_project(name: str, sync_first: bool) -> tuple[str | None, str | None]:
+    """The gid of the one project called name, or why there isn't one.
+
+    Unlike a search, a typo doesn't match: the project's name has to be name,
+    or contain it.
+    """
+    matches = src.search.search(name, sync_first)
+    if matches is None:
+        return None, "couldn't search projects"
+    query = src.search.normalize(name)
+    names = {match["gid"]: src.search.normalize(match["name"]) for match in matches}
+    exact = [gid for gid, other in names.items() if other == query]
+    found = exact or [gid for gid, other in names.items() if query in other]
+    if len(found) == 1:
+        return found[0], None
+    if not found:
+        return None, "no project with that name"
+    listed = [match["name"] for match in matches if match["gid"] in found]
+    more = ", ..." if len(listed) > 3 else ""
+    return None, f"{len(found)} projects match: {', '.join(listed[:3])}{more}"
+
+
+def resolve(rows: list[dict]) -> tuple[dict[str, dict], list[tuple[dict, str]]]:
+    """Fetch the projects the rows are for.
+
+    Sets row["gid"] on every row that can be applied, and returns the fetched
+    projects by gid along with the rows that can't be, and why.
+    """
+    failed = []
+    # The workspace is listed for the first name only
+    synced = False
+    for row in rows:
+        error = check_action(row)
+        if error is None and not row["project"]:
+            error = "no project given"
+        if error is None:
+            if row["project"].isdigit():
+                row["gid"] = row["project"]
+            else:
+                row["gid"], error = find_project(row["project"], not synced)
+                synced = True
+        if error is not None:
+            row["gid"] = None
+            failed.append((row, error))
+
+    gids = list(dict.fromkeys(row["gid"] for row in rows if row["gid"]))
+    fetched = src.aio.run(src.aio.get_projects(gids, "name,notes,color,modified_at"))
+    projects = {gid: data for gid, data in zip(gids, fetched) if data}
+    for data in projects.values():
+        src.updates.remember(data)
+    for row in rows:
+        if row["gid"] and row["gid"] not in projects:
+            failed.append((row, "no project with that gid"))
+            row["gid"] = None
+    return projects, failed
+
+
+def apply(row: dict, data: dict, updates: "src.updates.UpdateQueue"):
+    action, argument = row["action"], row["argument"]
+    if action == "a":
+        data["notes"] = src.utils.add_to_notes(
+            argument, data["notes"], data["gid"], True, updates
+        )
+        if src.config.ADMIN_MODE:
+            updates.set_color(data["gid"], "light-purple")
+    elif action == "h":
+        data["notes"] = src.utils.add_to_notes(
+            "hold " + src.utils.hold_date(argument),  # pyright: ignore
+            data["notes"],
+            data["gid"],
+            True,
+            updates,
+        )
+    elif action == "m":
+        data["notes"] = src.utils.add_to_notes(
+            "lm", data["notes"], data["gid"], True, updates
+        )
+    elif action == "w":
+        src.utils.generate_warning(data, updates)
+    elif action == "qs":
+        sr, pg = argument.split()
+        src.utils.multiple_questionnaires(data, sr, pg, updates)
+
+
+def run(path: str):
+    """Apply every action in the file at path without asking for anything.
+
+    Every row is checked and its project found before anything is written.
+    Rows for the same project are applied in order on top of each other, and
+    all the projects are then written together through the batch API.
+    """
+    src.config.get_consts()
+    rows, unreadable = read_rows(path)
+    if not rows and not unreadable:
+        print("No actions found.")
+        return
+    print(f"Checking {len(rows) + len(unreadable)} actions...")
+    projects, failed = resolve(rows) if rows else ({}, [])
+    failed += unreadable
+
+    applied = [row for row in rows if row["gid"]]
+    updates = src.updates.UpdateQueue()
+    for row in applied:
+        apply(row, projects[row["gid"]], updates)
+    not_written = set(updates.flush())
+
+    for row in applied:
+        if row["gid"] in not_written:
+            failed.append((row, "couldn't update the project"))
+    total = len(rows) + len(unreadable)
+    print(f"Applied {total - len(failed)} of {total} actions.")
+    if failed:
+        print(f"Failed for {len(failed)} actions:")
+        for row, error in sorted(failed, key=lambda failure: failure[0]["line"]):
+            if row["project"] or row["action"]:
+                print(
+                    f"  Line {row['line']} ({row['project']}, {row['action']}): {error}"
+                )
+            else:
+                print(f"  Line {row['line']}: {error}")
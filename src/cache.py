@@ -0,0 +1,437 @@
+import sqlite3
+import threading
+import time
+
+from asana.rest import ApiException
+
+import src.aio
+import src.config
+import src.search
+import src.timing
+import src.updates
+
+LIST_FIELDS = "name,color,modified_at"
+DETAIL_FIELDS = "name,color,permalink_url,notes,modified_at"
+
+# Projects are read from the cache this many at a time, as a listing page is
+PAGE_SIZE = 100
+# Link checks older than this are dropped, even completed ones
+LINK_KEEP_AGE = 30 * 24 * 60 * 60
+
+_connection = None
+# The connection is shared between threads, one at a time. The lock is only
+# held for database work, never while waiting on Asana: the threads that send
+# requests also invalidate() what they changed.
+_lock = threading.RLock()
+
+
+def connect():
+    global _connection
+    if _connection is None:
+        src.config.CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _connection = sqlite3.connect(src.config.CACHE_PATH, check_same_thread=False)
+        _connection.row_factory = sqlite3.Row
+        _connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS projects (
+                gid TEXT PRIMARY KEY,
+                workspace TEXT NOT NULL,
+                name TEXT,
+                color TEXT,
+                permalink_url TEXT,
+                notes TEXT,
+                modified_at TEXT,
+                listed_modified_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS syncs (
+                workspace TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS project_names USING fts5(
+                name,
+                indexed_name UNINDEXED,
+                tokenize = 'trigram'
+            );
+            CREATE TABLE IF NOT EXISTS link_checks (
+                url TEXT PRIMARY KEY,
+                complete INTEGER NOT NULL,
+                checked_at REAL NOT NULL
+            );
+            """
+        )
+        with _connection:
+            _connection.execute(
+                "DELETE FROM link_checks WHERE checked_at < ?",
+                (time.time() - LINK_KEEP_AGE,),
+            )
+    return _connection
+
+
+def _list_pages(opt_fields):
+    return src.aio.iterate(src.aio.list_project_pages(opt_fields))
+
+
+def _store_details(db, project):
+    db.execute(
+        """
+        INSERT INTO projects
+            (gid, workspace, name, color, permalink_url, notes, modified_at, listed_modified_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(gid) DO UPDATE SET
+            name = excluded.name,
+            color = excluded.color,
+            permalink_url = excluded.permalink_url,
+            notes = excluded.notes,
+            modified_at = excluded.modified_at,
+            listed_modified_at = excluded.listed_modified_at
+        """,
+        (
+            project["gid"],
+            src.config.WORKSPACE_GID,
+            project["name"],
+            project["color"],
+            project["permalink_url"],
+            project["notes"],
+            project["modified_at"],
+            project["modified_at"],
+        ),
+    )
+
+
+def _store_listed(db, page):
+    db.executemany(
+        """
+        INSERT INTO projects (gid, workspace, name, color, listed_modified_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(gid) DO UPDATE SET
+            name = excluded.name,
+            color = excluded.color,
+            listed_modified_at = excluded.listed_modified_at
+        """,
+        (
+            (
+                project["gid"],
+                src.config.WORKSPACE_GID,
+                project["name"],
+                project["color"],
+                project["modified_at"],
+            )
+            for project in page
+        ),
+    )
+
+
+@src.timing.timed("cache.fetch_details")
+def _fetch_details(db, gids):
+    if not gids:
+        return
+    details = src.aio.run(src.aio.get_projects(gids, DETAIL_FIELDS))
+    with _lock, db:
+        for gid, project in zip(gids, details):
+            if project is None:
+                db.execute("DELETE FROM projects WHERE gid = ?", (gid,))
+            else:
+                _store_details(db, project)
+
+
+def _needs_sync(db) -> bool:
+    row = db.execute(
+        "SELECT synced_at FROM syncs WHERE workspace = ?",
+        (src.config.WORKSPACE_GID,),
+    ).fetchone()
+    return not row or time.time() - row["synced_at"] >= src.config.CACHE_MAX_AGE
+
+
+def _sync_pages(db):
+    """List the workspace into the cache, yielding each page's gids once stored.
+
+    The listing only carries names, colors and modified_at, which is enough to
+    tell which cached notes are out of date.
+    """
+    workspace = src.config.WORKSPACE_GID
+    seen = set()
+    for page in _list_pages(LIST_FIELDS):
+        with _lock, src.timing.span("cache.sync"), db:
+            _store_listed(db, page)
+        gids = [project["gid"] for project in page]
+        seen.update(gids)
+        yield gids
+
+    with _lock, src.timing.span("cache.sync"), db:
+        # Anything no longer listed has been archived or deleted
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS seen (gid TEXT PRIMARY KEY)")
+        db.execute("DELETE FROM seen")
+        db.executemany("INSERT INTO seen VALUES (?)", ((gid,) for gid in seen))
+        db.execute(
+            "DELETE FROM projects WHERE workspace = ? AND gid NOT IN (SELECT gid FROM seen)",
+            (workspace,),
+        )
+        _index_names(db)
+        db.execute(
+            "INSERT OR REPLACE INTO syncs (workspace, synced_at) VALUES (?, ?)",
+            (workspace, time.time()),
+        )
+
+
+def _cached_pages(db):
+    """Yield the gids of the cached projects, PAGE_SIZE at a time."""
+    after = 0
+    while True:
+        with _lock:
+            rows = db.execute(
+                """
+                SELECT rowid, gid FROM projects
+                WHERE workspace = ? AND rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+                """,
+                (src.config.WORKSPACE_GID, after, PAGE_SIZE),
+            ).fetchall()
+        if not rows:
+            return
+        after = rows[-1]["rowid"]
+        yield [row["gid"] for row in rows]
+
+
+def sync(force=False):
+    """List the workspace unless that was done in the last CACHE_MAX_AGE seconds."""
+    with _lock:
+        db = connect()
+        if not force and not _needs_sync(db):
+            return
+    for _ in _sync_pages(db):
+        pass
+
+
+def _index_names(db):
+    """Index the names of projects that are new or renamed since last time.
+
+    Run after each listing, so searches in between use the index as it is.
+    Each project is indexed under its rowid in projects.
+    """
+    changed = db.execute(
+        """
+        SELECT projects.rowid AS id, projects.name FROM projects
+        LEFT JOIN project_names ON project_names.rowid = projects.rowid
+        WHERE project_names.indexed_name IS NOT projects.name
+        """
+    ).fetchall()
+    for row in changed:
+        db.execute("DELETE FROM project_names WHERE rowid = ?", (row["id"],))
+        db.execute(
+            "INSERT INTO project_names (rowid, name, indexed_name) VALUES (?, ?, ?)",
+            (row["id"], src.search.normalize(row["name"] or ""), row["name"]),
+        )
+    # Projects that are gone from the cache
+    db.execute(
+        "DELETE FROM project_names WHERE rowid NOT IN (SELECT rowid FROM projects)"
+    )
+
+
+def name_matches(name: str, limit: int, sync_first: bool = True) -> list[dict] | None:
+    """Projects whose (normalized) names contain name or share trigrams with it.
+
+    Every project whose name contains name is returned, along with up to
+    limit others, best match by bm25 first. Syncs first unless told not to,
+    but fetches no details: each comes with its gid, name and color only.
+    """
+    try:
+        if sync_first:
+            sync()
+    except ApiException as e:
+        print("Exception when syncing the project cache: %s\n" % e)
+        return
+    with _lock:
+        db = connect()
+        # Caches from before there was an index get one built now
+        if db.execute("SELECT 1 FROM project_names LIMIT 1").fetchone() is None:
+            with db:
+                _index_names(db)
+        # Names are normalized, so nothing in name is special to GLOB, and the
+        # trigram index answers it for names of three characters or more
+        rows = db.execute(
+            """
+            SELECT projects.gid, projects.name, projects.color
+            FROM project_names
+            JOIN projects ON projects.rowid = project_names.rowid
+            WHERE project_names.name GLOB ? AND projects.workspace = ?
+            """,
+            (f"*{name}*", src.config.WORKSPACE_GID),
+        )
+        matches = {row["gid"]: dict(row) for row in rows}
+        if len(name) < 3:
+            # Too short for a trigram to match anything else
+            return list(matches.values())
+        match = " OR ".join(
+            f'"{trigram}"' for trigram in sorted(src.search.trigrams(name))
+        )
+        rows = db.execute(
+            """
+            SELECT projects.gid, projects.name, projects.color
+            FROM project_names
+            JOIN projects ON projects.rowid = project_names.rowid
+            WHERE project_names MATCH ? AND projects.workspace = ?
+            ORDER BY bm25(project_names)
+            LIMIT ?
+            """,
+            (match, src.config.WORKSPACE_GID, limit),
+        )
+        for row in rows:
+            matches.setdefault(row["gid"], dict(row))
+        return list(matches.values())
+
+
+def get_project(gid):
+    """One project's details, fetched again only if they changed."""
+    with _lock:
+        db = connect()
+        row = db.execute(
+            """
+            SELECT notes IS NULL OR modified_at IS NOT listed_modified_at AS stale
+            FROM projects WHERE gid = ?
+            """,
+            (gid,),
+        ).fetchone()
+    try:
+        if row is None or row["stale"]:
+            _fetch_details(db, [gid])
+    except ApiException as e:
+        print("Exception when fetching project %s: %s\n" % (gid, e))
+        return
+    with _lock:
+        row = db.execute(
+            """
+            SELECT gid, name, color, permalink_url, notes, modified_at FROM projects
+            WHERE gid = ?
+            """,
+            (gid,),
+        ).fetchone()
+        if row is None:
+            return None
+        src.updates.remember(dict(row))
+        return dict(row)
+
+
+def _details(db, gids, where) -> list[dict]:
+    """The details of those of gids for which where(project) is true."""
+    placeholders = ", ".join("?" * len(gids))
+    with _lock:
+        listed = db.execute(
+            f"""
+            SELECT gid, name, color,
+                notes IS NULL OR modified_at IS NOT listed_modified_at AS stale
+            FROM projects
+            WHERE gid IN ({placeholders})
+            """,
+            gids,
+        ).fetchall()
+    wanted = [dict(row) for row in listed]
+    if where is not None:
+        wanted = [project for project in wanted if where(project)]
+    if not wanted:
+        return []
+    _fetch_details(db, [project["gid"] for project in wanted if project["stale"]])
+    placeholders = ", ".join("?" * len(wanted))
+    with _lock:
+        rows = db.execute(
+            f"""
+            SELECT gid, name, color, permalink_url, notes, modified_at FROM projects
+            WHERE gid IN ({placeholders})
+            ORDER BY rowid
+            """,
+            [project["gid"] for project in wanted],
+        ).fetchall()
+    # Re-check the fresh details, e.g. a project whose color just changed
+    projects = [dict(row) for row in rows if where is None or where(row)]
+    for project in projects:
+        src.updates.remember(project)
+    return projects
+
+
+def iter_projects(where=None):
+    """Yield the cached projects for which where(project) is true, syncing first.
+
+    where is given each project's gid, name and color. Notes and links are
+    only fetched for the projects it selects, and only when they changed.
+    Projects come a page at a time: when the workspace has to be listed, each
+    page is handled as soon as it arrives, so the first ones are ready long
+    before the listing is done, and only a page of notes is held at once.
+    An ApiException partway through is raised to whoever is iterating.
+    """
+    with _lock:
+        db = connect()
+        pages = _sync_pages(db) if _needs_sync(db) else _cached_pages(db)
+    for gids in pages:
+        yield from _details(db, gids, where)
+
+
+def get_projects(where=None):
+    """Return the cached projects for which where(project) is true, syncing first."""
+    try:
+        return list(iter_projects(where))
+    except ApiException as e:
+        print("Exception when syncing the project cache: %s\n" % e)
+        return
+
+
+def invalidate(project_gid):
+    """Forget the cached details of a project we just changed."""
+    with _lock:
+        db = connect()
+        with db:
+            db.execute(
+                "UPDATE projects SET notes = NULL, modified_at = NULL WHERE gid = ?",
+                (project_gid,),
+            )
+
+
+def clear():
+    """Drop everything cached for the workspace, forcing a full fetch next time."""
+    with _lock:
+        db = connect()
+        with db:
+            db.execute(
+                "DELETE FROM projects WHERE workspace = ?", (src.config.WORKSPACE_GID,)
+            )
+            db.execute(
+                "DELETE FROM syncs WHERE workspace = ?", (src.config.WORKSPACE_GID,)
+            )
+
+
+def link_status(url: str) -> bool | None:
+    """Whether url was complete when last checked, if that can still be trusted.
+
+    A completed questionnaire stays completed. One that wasn't is only worth
+    checking again once LINK_RECHECK_AGE has passed; until then this returns
+    False, and None means it has to be checked.
+    """
+    with _lock:
+        db = connect()
+        row = db.execute(
+            "SELECT complete, checked_at FROM link_checks WHERE url = ?", (url,)
+        ).fetchone()
+    if row is None:
+        return None
+    if row["complete"]:
+        return True
+    if time.time() - row["checked_at"] < src.config.LINK_RECHECK_AGE:
+        return False
+    return None
+
+
+def record_link(url: str, complete: bool):
+    with _lock:
+        db = connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO link_checks (url, complete, checked_at) VALUES (?, ?, ?)",
+                (url, complete, time.time()),
+            )
+
+
+def forget_link_checks():
+    """Check every link again next time."""
+    with _lock:
+        db = connect()
+        with db:
+            db.execute("DELETE FROM link_checks")
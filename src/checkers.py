@@ -0,0 +1,195 @@
+import contextlib
+import queue
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+import urllib3
+
+import src.cache
+import src.config
+import src.timing
+import src.websites
+
+# At most this many links per site are checked at the same time
+MAX_PER_DOMAIN = 3
+
+_http = None
+
+
+def http() -> urllib3.PoolManager:
+    global _http
+    if _http is None:
+        _http = urllib3.PoolManager(
+            maxsize=10,
+            retries=urllib3.Retry(total=2, backoff_factor=0.5),
+            timeout=urllib3.Timeout(connect=5, read=15),
+            headers={"User-Agent": "Mozilla/5.0 (asana-script)"},
+        )
+    return _http
+
+
+class SessionPool:
+    """Up to `size` headless browser sessions, shared between threads.
+
+    A session is only started when a check needs a browser and no started
+    one is free, and each is used by one thread at a time.
+    """
+
+    def __init__(self, size: int = 1):
+        self._slots = threading.Semaphore(size)
+        self._idle = queue.SimpleQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def session(self):
+        with self._slots:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                session = src.websites.DriverSession("headless")
+                with self._lock:
+                    self._sessions.append(session)
+            try:
+                yield session
+            finally:
+                self._idle.put(session)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+
+
+class CompletionChecker:
+    """Decides whether a questionnaire link on one site has been completed.
+
+    The page is fetched over plain HTTP first. If that can't give an answer
+    (the request failed, or the site renders its completion message with
+    JavaScript and it isn't in the raw HTML), the link is loaded in Chrome.
+    """
+
+    def __init__(self, completed_text: str, rendered_by_js: bool = False):
+        self.completed_text = completed_text
+        self.rendered_by_js = rendered_by_js
+
+    def check_http(self, url: str) -> bool | None:
+        try:
+            with src.timing.span("http.page_load"):
+                response = http().request("GET", url)
+        except urllib3.exceptions.HTTPError:
+            return None
+        if response.status >= 400:
+            return None
+        if self.completed_text in response.data.decode("utf-8", errors="replace"):
+            return True
+        return None if self.rendered_by_js else False
+
+    def check_browser(self, sessions: SessionPool, url: str) -> bool:
+        with sessions.session() as session:
+            return src.websites.page_has_text(session.driver, url, self.completed_text)
+
+    def check(self, sessions: SessionPool, url: str) -> bool:
+        complete = self.check_http(url)
+        if complete is None:
+            complete = self.check_browser(sessions, url)
+        return complete
+
+
+checkers = {
+    "mhs.com": CompletionChecker("Thank you for completing"),
+    "pearsonassessments.com": CompletionChecker("Test Completed!", rendered_by_js=True),
+}
+
+
+def domain_for(url: str) -> str | None:
+    host = urlparse(url).hostname or ""
+    for domain in src.config.allowed_domains:
+        if host == domain or host.endswith("." + domain):
+            return domain
+    return None
+
+
+def is_complete(sessions: SessionPool, q_link: str) -> bool:
+    """Check a link, unless a recent enough answer is in src.cache."""
+    url = q_link.split(" ")[0]
+    checker = checkers.get(domain_for(url))  # pyright: ignore
+    if checker is None:
+        return False
+    complete = src.cache.link_status(url)
+    if complete is None:
+        complete = checker.check(sessions, url)
+        src.cache.record_link(url, complete)
+    return complete
+
+
+class LinkChecker:
+    """Checks links in the background, with a separate queue for each site.
+
+    Each site gets its own worker threads (up to `workers`, and never more
+    than MAX_PER_DOMAIN), so a slow site can't hold up the links of another.
+    The sites share up to `workers` headless browser sessions (started only
+    if a link needs one), so a single worker means a single browser. Results
+    come back as futures, in whatever order they finish.
+    """
+
+    def __init__(self, workers: int = 1, per_domain: int = MAX_PER_DOMAIN):
+        http()
+        self._workers = max(1, min(workers, per_domain))
+        self._queues: dict[str | None, queue.SimpleQueue] = {}
+        self._threads = []
+        self._sessions = SessionPool(self._workers)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _work(self, links: queue.SimpleQueue):
+        while (item := links.get()) is not None:
+            q_link, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(is_complete(self._sessions, q_link))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _queue(self, domain: str | None) -> queue.SimpleQueue:
+        with self._lock:
+            if domain not in self._queues:
+                links = self._queues[domain] = queue.SimpleQueue()
+                for _ in range(self._workers):
+                    thread = threading.Thread(
+                        target=self._work, args=(links,), daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+            return self._queues[domain]
+
+    def submit(self, q_link: str) -> Future[bool]:
+        future = Future()
+        self._queue(domain_for(q_link.split(" ")[0])).put((q_link, future))
+        return future
+
+    def close(self):
+        with self._lock:
+            queues = list(self._queues.values())
+        # Links still waiting are dropped, the ones being checked finish
+        for links in queues:
+            while True:
+                try:
+                    item = links.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[1].cancel()
+            for _ in range(self._workers):
+                links.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._sessions.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
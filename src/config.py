@@ -1,38 +1,89 @@
 from os import getenv
+from pathlib import Path
 
-import asana
-import keyring
 from dotenv import load_dotenv
 
+# asana and keyring are imported where they're used, so commands that don't
+# need them (like --help) start quickly
+
 load_dotenv()
 
 ADMIN_MODE = getenv("ADMIN_MODE", "True").lower() in ["true", "1", "yes"]
 
+CACHE_PATH = Path(
+    getenv("ASANA_CACHE_PATH", Path.home() / ".asana-script" / "projects.sqlite")
+).expanduser()
+# How long (in seconds) a workspace listing is trusted before listing again
+CACHE_MAX_AGE = int(getenv("ASANA_CACHE_MAX_AGE", "300"))
+# How long (in seconds) a questionnaire found incomplete isn't checked again
+LINK_RECHECK_AGE = int(getenv("LINK_RECHECK_AGE", str(6 * 60 * 60)))
+
+# Cookies of the portals the browser logged into, reused by the next run
+SESSIONS_PATH = Path(
+    getenv("BROWSER_SESSIONS_PATH", Path.home() / ".asana-script" / "sessions")
+).expanduser()
+
+# A database on a drive every operator can reach. When set, operators going
+# through the same colors at once are each handed different projects.
+LEASES_PATH = getenv("ASANA_LEASES_PATH") or None
+# How long (in seconds) a project stays with an operator who stopped working
+LEASE_SECONDS = int(getenv("ASANA_LEASE_SECONDS", str(15 * 60)))
+
+# Connections kept open to Asana, enough for every fetch src.aio runs at once
+CONNECTION_POOL_SIZE = 16
+
+# get_consts only builds the client (and its connection pool) once per run,
+# and get_secret only asks the keyring for each secret once
+_consts_loaded = False
+_secrets = {}
+
+
+def create_api_client(configuration):
+    import asana
 
-# This is a hack to fix AttributeError: 'NoneType' object has no attribute 'dumps', which seems to not actually effect the functionality, but prints a Traceback
-class CustomApiClient(asana.ApiClient):
-    def __del__(self):
-        try:
-            super().__del__()
-        except AttributeError:
-            pass
+    # This is a hack to fix AttributeError: 'NoneType' object has no attribute 'dumps', which seems to not actually effect the functionality, but prints a Traceback
+    class CustomApiClient(asana.ApiClient):
+        def __del__(self):
+            try:
+                super().__del__()
+            except AttributeError:
+                pass
+
+    return CustomApiClient(configuration)
 
 
 def get_consts():
     global \
         configuration, \
         projects_api_instance, \
+        batch_api_instance, \
         WORKSPACE_GID, \
         ASANA_COLORS, \
         INITIALS, \
-        allowed_domains
+        allowed_domains, \
+        _consts_loaded
+
+    if _consts_loaded:
+        return
+
+    import asana
+    import urllib3
 
     configuration = asana.Configuration()
+    # Lets the benchmarks point the client at a local stand-in for Asana
+    configuration.host = getenv("ASANA_HOST", configuration.host)
+    configuration.connection_pool_maxsize = CONNECTION_POOL_SIZE
 
     configuration.access_token = get_secret("ASANA_TOKEN", "token")
 
-    api_client = CustomApiClient(configuration)
+    api_client = create_api_client(configuration)
+    # urllib3 would otherwise quietly retry 429s and 503s itself; src.ratelimit
+    # handles those so they pause every request and show up in its counters
+    api_client.rest_client.pool_manager.connection_pool_kw["retries"] = urllib3.Retry(
+        connect=2, read=0, status=0, respect_retry_after_header=False
+    )
     projects_api_instance = asana.ProjectsApi(api_client)
+    batch_api_instance = asana.BatchAPIApi(api_client)
 
     WORKSPACE_GID = get_secret("ASANA_WORKSPACE_GID", "workspace")
 
@@ -42,14 +93,21 @@ def get_consts():
 
     allowed_domains = ["mhs.com", "pearsonassessments.com"]
 
+    _consts_loaded = True
+
 
 def get_secret(env_name, key_name):
+    if key_name in _secrets:
+        return _secrets[key_name]
     secret = getenv(env_name)
     if not secret:
+        import keyring
+
         secret = keyring.get_password("asana", key_name)
         if not secret:
             secret = input(f"Enter your {key_name}: ")
             keyring.set_password("asana", key_name, secret)
+    _secrets[key_name] = secret
     return secret
 
 
@@ -57,6 +115,9 @@ def reset(key: str):
     valid_keys = ["all", "token", "initials"]
     if key not in valid_keys:
         raise ValueError(f"Invalid key. Must be one of: {', '.join(valid_keys)}")
+    import keyring
+
+    _secrets.clear()
     if key == "all":
         if keyring.get_password("asana", "token"):
             keyring.delete_password("asana", "token")
@@ -0,0 +1,125 @@
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import src.config
+
+# Projects someone finished aren't handed out again for this long
+DONE_KEEP = 12 * 60 * 60
+
+
+class Leases:
+    """Hands each operator different projects of a color run.
+
+    Operators share a SQLite database (src.config.LEASES_PATH). A project is
+    leased to whoever claims it first, until they're done with it or their
+    lease runs out, so a crashed run doesn't hold on to its projects. Without
+    a LEASES_PATH every project can be claimed.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path or src.config.LEASES_PATH
+        self.owner = (
+            f"{src.config.INITIALS} on {socket.gethostname()} ({uuid.uuid4().hex[:8]})"
+        )
+        # Projects claimed here that other operators got first
+        self.taken = 0
+        self._db = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        if self.path:
+            # A shared drive can be slow to hand over the file's lock
+            self._db = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS leases (
+                    gid TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            others = self.operators()
+            if others:
+                print(f"Sharing the list with {', '.join(others)}.")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _execute(self, sql: str, parameters=()) -> list[tuple]:
+        with self._lock:
+            if self._db is None:
+                return []
+            return self._db.execute(sql, parameters).fetchall()
+
+    def operators(self) -> list[str]:
+        """The other operators holding projects right now."""
+        rows = self._execute(
+            """
+            SELECT DISTINCT owner FROM leases
+            WHERE owner != ? AND done = 0 AND expires_at > ?
+            """,
+            (self.owner, time.time()),
+        )
+        return [row[0] for row in rows]
+
+    def claim(self, project_gid: str) -> bool:
+        """Lease the project unless another operator has it or is done with it."""
+        with self._lock:
+            if self._closed:
+                return False
+            if self._db is None:
+                return True
+            now = time.time()
+            claimed = self._db.execute(
+                """
+                INSERT INTO leases (gid, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(gid) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at,
+                    done = 0
+                WHERE leases.expires_at < ?
+                    OR (leases.owner = excluded.owner AND leases.done = 0)
+                """,
+                (project_gid, self.owner, now + src.config.LEASE_SECONDS, now),
+            ).rowcount
+            if not claimed:
+                self.taken += 1
+            return bool(claimed)
+
+    def claimed(self, projects):
+        """The projects this operator got, out of projects."""
+        for data in projects:
+            if self.claim(data["gid"]):
+                yield data
+
+    def renew(self):
+        """Keep the projects this operator is still working on."""
+        self._execute(
+            "UPDATE leases SET expires_at = ? WHERE owner = ? AND done = 0",
+            (time.time() + src.config.LEASE_SECONDS, self.owner),
+        )
+
+    def finish(self, project_gid: str):
+        """Mark the project as done, so nobody else goes through it today."""
+        self._execute(
+            "UPDATE leases SET done = 1, expires_at = ? WHERE gid = ? AND owner = ?",
+            (time.time() + DONE_KEEP, project_gid, self.owner),
+        )
+
+    def close(self):
+        """Hand back the projects this operator claimed but didn't get to."""
+        self._execute("DELETE FROM leases WHERE owner = ? AND done = 0", (self.owner,))
+        with self._lock:
+            self._closed = True
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,128 @@
+import difflib
+import re
+
+import src.config
+
+# A link runs from its URL to the end of its line
+LINK = re.compile(r"https?://\S.*")
+HOLD = re.compile(r"hold\s+(\d{1,2}/\d{1,2})")
+
+
+class NoteState:
+    """Everything the color run needs to know about a project's notes."""
+
+    __slots__ = (
+        "notes",
+        "first_line",
+        "lm_count",
+        "lm_top",
+        "warning_on_top",
+        "hold",
+        "open_links",
+        "done_links",
+    )
+
+    def __init__(self, notes: str):
+        self.notes = notes
+        self.first_line = ""
+        self.lm_count = 0
+        self.lm_top = 0
+        self.warning_on_top = False
+        self.hold: str | None = None
+        self.open_links: list[str] = []
+        self.done_links: list[str] = []
+
+
+def parse(
+    notes: str, initials: str | None = None, domains: list[str] | None = None
+) -> NoteState:
+    """Read everything NoteState holds out of a project's notes at once.
+
+    A questionnaire link is done once " - DONE" has been appended to it.
+    """
+    if initials is None:
+        initials = src.config.INITIALS
+    if domains is None:
+        domains = src.config.allowed_domains
+    lm = f"lm {initials}"
+    state = NoteState(notes)
+
+    hold_match = HOLD.search(notes)
+    if hold_match:
+        state.hold = hold_match.group(1)
+
+    lower = notes.lower()
+    state.lm_count = lower.count(lm)
+    lines = notes.splitlines()
+    if lines:
+        state.first_line = lines[0]
+        state.warning_on_top = f"lw {initials}" in lines[0].lower()
+    for line in lines:
+        if lm not in line.lower():
+            break
+        state.lm_top += 1
+
+    for link in LINK.findall(notes):
+        if any(domain in link for domain in domains):
+            if " - DONE" in link:
+                state.done_links.append(link)
+            else:
+                state.open_links.append(link)
+    return state
+
+
+def state_of(data: dict) -> NoteState:
+    """Parse data["notes"], reusing the last result while they're unchanged."""
+    state = data.get("note_state")
+    if state is None or state.notes is not data["notes"]:
+        state = data["note_state"] = parse(data["notes"])
+    return state
+
+
+def _find(lines: list[str], wanted: list[str]) -> int | None:
+    for i in range(len(lines) - len(wanted) + 1):
+        if lines[i : i + len(wanted)] == wanted:
+            return i
+    return None
+
+
+def merge(base: str, ours: str, theirs: str) -> str | None:
+    """Redo the change from base to ours on theirs, a newer version of base.
+
+    Added lines are added after the same line in theirs (or on top), and
+    changed lines, like a link marked done, are changed where they are now.
+    Returns None if a line that was changed has since been changed in theirs
+    too, or if the line added after is gone.
+    """
+    base_lines, our_lines = base.splitlines(), ours.splitlines()
+    merged = theirs.splitlines()
+    opcodes = difflib.SequenceMatcher(
+        None, base_lines, our_lines, autojunk=False
+    ).get_opcodes()
+    for tag, i1, i2, j1, j2 in reversed(opcodes):
+        if tag == "equal":
+            continue
+        old, new = base_lines[i1:i2], our_lines[j1:j2]
+        if old:
+            at = _find(merged, old)
+            if at is None:
+                # Fine if they made the same change
+                if _find(merged, new) is not None:
+                    continue
+                return None
+        elif i1 == 0:
+            at = 0
+        else:
+            at = _find(merged, base_lines[i1 - 1 : i1])
+            if at is None:
+                return None
+            at += 1
+        if not old:
+            # Lines of ours that were already written don't go in twice
+            overlap = next(
+                (k for k in range(len(new), 0, -1) if merged[at : at + k] == new[-k:]),
+                0,
+            )
+            new = new[: len(new) - overlap]
+        merged[at : at + len(old)] = new
+    return "\n".join(merged) + ("\n" if theirs.endswith("\n") else "")
@@ -0,0 +1,149 @@
+import csv
+
+from selenium.common.exceptions import WebDriverException
+
+import src.aio
+import src.api
+import src.config
+import src.notes
+import src.timing
+import src.updates
+import src.utils
+import src.websites
+
+# Which questionnaires a diagnosis in a project's name calls for
+FOR_DIAGNOSIS = {"ASD": "asrs", "ADHD": "conners"}
+# Columns a CSV of clients has to have
+CSV_COLUMNS = ["firstname", "lastname", "questionnaires"]
+
+
+def client_from_project(data: dict) -> dict:
+    # A diagnosis can be written outside the tags, as in "Jane Doe ADHD"
+    name = src.api.NAME_TAGS.sub("", data["name"])
+    name = src.api.DIAGNOSES.sub("", name)
+    name = src.api.WHITESPACE.sub(" ", name).strip().split(" ")
+    return {
+        "firstname": name[0],
+        "lastname": name[-1],
+        "questionnaires": [
+            FOR_DIAGNOSIS[diagnosis]
+            for diagnosis in src.api.DIAGNOSES.findall(data["name"])
+        ],
+        "project": data,
+    }
+
+
+def clients_from_asana(colors=None) -> list[dict]:
+    """Clients in the given colors who haven't been sent questionnaires yet."""
+    clients = []
+    for data in src.api.get_asana_tasks_by_color(colors) or []:
+        state = src.notes.state_of(data)
+        if state.open_links or state.done_links:
+            print(f"Skipping {data['name']}, questionnaires already sent.")
+            continue
+        client = client_from_project(data)
+        if client["questionnaires"]:
+            clients.append(client)
+    return clients
+
+
+def check_row(row: dict) -> str | None:
+    """Why a row of the CSV can't be used, if it can't."""
+    if not (row["firstname"] or "").strip() or not (row["lastname"] or "").strip():
+        return "no first or last name"
+    questionnaires = (row["questionnaires"] or "").lower().split()
+    if not questionnaires:
+        return "no questionnaires"
+    unknown = [name for name in questionnaires if name not in FOR_DIAGNOSIS.values()]
+    if unknown:
+        return f"unknown questionnaires {', '.join(unknown)}"
+    return None
+
+
+def clients_from_csv(path: str) -> list[dict]:
+    """Clients listed in a CSV file.
+
+    The columns are firstname, lastname, questionnaires (any of "asrs" and
+    "conners", space separated) and optionally gid, the client's project, to
+    write the links to. Rows that can't be used are reported and left out,
+    and a file missing a column gives no clients at all.
+    """
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        missing = [
+            column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])
+        ]
+        if missing:
+            print(f"{path} is missing the columns: {', '.join(missing)}")
+            return []
+        rows = []
+        for line_number, row in enumerate(reader, 2):
+            error = check_row(row)
+            if error:
+                print(f"Leaving out line {line_number}: {error}")
+            else:
+                rows.append(row)
+    gids = [row["gid"] for row in rows if row.get("gid")]
+    projects = {}
+    if gids:
+        fetched = src.aio.run(src.aio.get_projects(gids, "name,notes,modified_at"))
+        projects = {data["gid"]: data for data in fetched if data}
+        for data in projects.values():
+            src.updates.remember(data)
+    return [
+        {
+            "firstname": row["firstname"].strip(),
+            "lastname": row["lastname"].strip(),
+            "questionnaires": row["questionnaires"].lower().split(),
+            "project": projects.get(row.get("gid") or ""),
+        }
+        for row in rows
+    ]
+
+
+def generate(csv_path: str | None = None, colors=None):
+    """Generate and send questionnaires for many clients in one browser.
+
+    Both portals are logged into once at the start. Links are written to each
+    client's project in the background while the next client is handled.
+    """
+    src.config.get_consts()
+    if csv_path:
+        clients = clients_from_csv(csv_path)
+    else:
+        clients = clients_from_asana(colors)
+    if not clients:
+        print("No clients found.")
+        return
+    print(f"Generating questionnaires for {len(clients)} clients.")
+
+    failed = []
+    with src.websites.DriverSession() as session, src.aio.WritePipeline():
+        portals = src.websites.Portals(session.driver)
+        for i, client in enumerate(clients, 1):
+            name = f"{client['firstname']} {client['lastname']}"
+            print(f"({i}/{len(clients)}) {name}: {', '.join(client['questionnaires'])}")
+            try:
+                with src.timing.span("questionnaires.client"):
+                    links = src.websites.send_questionnaires(
+                        portals,
+                        client["firstname"],
+                        client["lastname"],
+                        client["questionnaires"],
+                    )
+            except Exception as e:
+                # Whatever went wrong, the other clients still get theirs
+                reason = e.msg if isinstance(e, WebDriverException) else repr(e)
+                print(f"Couldn't generate questionnaires for {name}: {reason}")
+                failed.append(name)
+                continue
+            message = "\n".join(
+                f"{link} - {rater} - {src.config.INITIALS}" for link, rater in links
+            )
+            print(message)
+            data = client["project"]
+            if links and data:
+                src.utils.add_to_notes(message, data["notes"], data["gid"])
+
+    if failed:
+        print(f"Failed for {len(failed)} clients: {', '.join(failed)}")
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from os import getenv
+
+import urllib3
+from asana.rest import ApiException
+
+import src.timing
+
+# Asana allows 1500 requests a minute on paid workspaces (150 on free ones)
+REQUESTS_PER_MINUTE = int(getenv("ASANA_REQUESTS_PER_MINUTE", "1500"))
+# Requests that can go out back to back before pacing kicks in
+BURST = 50
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+# Errors worth retrying: rate limiting, and Asana or the network having a moment
+RETRY_STATUSES = {0, 429, 500, 502, 503, 504}
+
+
+class Scheduler:
+    """Paces Asana requests to stay under the rate limit, and retries them.
+
+    Requests draw from a token bucket refilled at the rate limit. A 429 pauses
+    every request until its Retry-After has passed; other transient failures
+    are retried after a jittered exponential backoff.
+    """
+
+    def __init__(self, per_minute: int = REQUESTS_PER_MINUTE, burst: int = BURST):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        # Time spent waiting is summed over every request that waited
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.paced_seconds = 0.0
+
+    def acquire(self, cost: int = 1):
+        """Block until cost requests may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                    self.throttled_seconds += wait
+                else:
+                    self._tokens = min(
+                        self.burst, self._tokens + (now - self._refilled_at) * self.rate
+                    )
+                    self._refilled_at = now
+                    if self._tokens >= min(cost, self.burst):
+                        self._tokens -= cost
+                        self.requests += cost
+                        return
+                    wait = (min(cost, self.burst) - self._tokens) / self.rate
+                    self.paced_seconds += wait
+            time.sleep(wait)
+
+    def throttle(self, retry_after: float):
+        """Hold back every request for retry_after seconds."""
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0
+
+    def backoff(self, attempt: int):
+        self.retries += 1
+        time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt)))
+
+    def retry(self, status: int | None, headers, attempt: int) -> bool:
+        """Wait out a failed request and say whether to send it again."""
+        if attempt >= MAX_RETRIES or status not in RETRY_STATUSES:
+            return False
+        if status == 429:
+            self.throttle(retry_after(headers))
+            self.retries += 1
+        else:
+            self.backoff(attempt)
+        return True
+
+    def call(self, function, *args, cost: int = 1, **kwargs):
+        """Call an asana client method, retrying it if it fails transiently.
+
+        cost is how many requests the call counts as, e.g. the number of
+        actions in a batch request.
+        """
+        attempt = 0
+        while True:
+            with src.timing.span("asana.rate_limit_wait"):
+                self.acquire(cost)
+            try:
+                with src.timing.span(f"asana.{function.__name__}"):
+                    return function(*args, **kwargs)
+            except ApiException as e:
+                if not self.retry(e.status, e.headers, attempt):
+                    raise
+            except urllib3.exceptions.HTTPError:
+                if not self.retry(0, None, attempt):
+                    raise
+            attempt += 1
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests, {self.retries} retries, "
+            f"throttled {self.throttled} times for {self.throttled_seconds:.1f} s, "
+            f"paced for {self.paced_seconds:.1f} s"
+        )
+
+
+def retry_after(headers) -> float:
+    try:
+        return float((headers or {}).get("Retry-After", ""))
+    except ValueError:
+        return BACKOFF_CAP
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def scheduler() -> Scheduler:
+    """The Scheduler every Asana request of this run goes through."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+    return _scheduler
+
+
+def call(function, *args, **kwargs):
+    return scheduler().call(function, *args, **kwargs)
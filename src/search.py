@@ -0,0 +1,56 @@
+import src.api
+import src.cache
+import src.timing
+
+# How many projects a search shows at most, unless more contain the query
+MAX_RESULTS = 20
+# How many of the index's best other matches are ranked here
+CANDIDATES = 200
+# Projects sharing less than this share of the query's trigrams aren't shown
+MIN_SCORE = 0.3
+
+
+def normalize(name: str) -> str:
+    """The name as the color run shows it: no tags or punctuation, lowercase."""
+    return " ".join(src.api.NAME_TAGS.sub("", name).lower().split())
+
+
+def trigrams(name: str) -> set[str]:
+    """Every three characters in a row, as SQLite's trigram tokenizer splits them."""
+    return {name[i : i + 3] for i in range(len(name) - 2)}
+
+
+@src.timing.timed("search.query")
+def search(
+    query: str, sync_first: bool = True, left_out: list[dict] | None = None
+) -> list[dict] | None:
+    """Projects whose names are like query, best match first.
+
+    Names are matched without their tags, so what the color run shows can be
+    typed in. Every name containing the query comes first, then names by how
+    many of the query's trigrams they share, so small typos still match. The
+    latter only fill up to MAX_RESULTS; those that don't fit are added to
+    left_out. Only the workspace listing is needed; notes are fetched once a
+    project is chosen. Searching many names in a row can list the workspace
+    for the first only.
+    """
+    query = normalize(query)
+    if not query:
+        return []
+    candidates = src.cache.name_matches(query, CANDIDATES, sync_first)
+    if candidates is None:
+        return None
+
+    wanted = trigrams(query)
+    results = []
+    for project in candidates:
+        name = normalize(project["name"])
+        contains = query in name
+        score = len(wanted & trigrams(name)) / len(wanted) if wanted else 0
+        if contains or score >= MIN_SCORE:
+            results.append((not contains, -score, len(name), project))
+    results.sort(key=lambda result: result[:3])
+    shown = max(MAX_RESULTS, sum(not result[0] for result in results))
+    if left_out is not None:
+        left_out.extend(result[3] for result in results[shown:])
+    return [result[3] for result in results[:shown]]
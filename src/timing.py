@@ -0,0 +1,96 @@
+import contextlib
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+
+# Spans are only recorded once enable() has been called (main.py --profile)
+_enabled = False
+_spans: list[tuple[str, int, int, int]] = []
+_lock = threading.Lock()
+_started_at = time.perf_counter_ns()
+
+
+def enable():
+    global _enabled, _started_at
+    _enabled = True
+    _started_at = time.perf_counter_ns()
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """Time the block as one occurrence of name."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        with _lock:
+            _spans.append((name, start, end, threading.get_ident()))
+
+
+def timed(name: str):
+    """Decorator version of span."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def prompt(text: str = "") -> str:
+    """input(), timed as waiting on the operator."""
+    with span("operator.input"):
+        return input(text)
+
+
+def summary() -> str:
+    """A table of how often each span ran and how long it took, slowest first.
+
+    Spans on different threads overlap, so totals can add up to more than the
+    run took.
+    """
+    with _lock:
+        spans = list(_spans)
+    durations = defaultdict(list)
+    for name, start, end, _ in spans:
+        durations[name].append((end - start) / 1e9)
+    wall = (time.perf_counter_ns() - _started_at) / 1e9
+    lines = [
+        f"Run took {wall:.2f} s",
+        f"{'span':<32} {'count':>6} {'total s':>9} {'mean ms':>9} {'max ms':>9}",
+    ]
+    for name, times in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        lines.append(
+            f"{name:<32} {len(times):6d} {sum(times):9.2f} "
+            f"{sum(times) / len(times) * 1000:9.1f} {max(times) * 1000:9.1f}"
+        )
+    return "\n".join(lines)
+
+
+def write_trace(path: str):
+    """Write the spans in Chrome's trace format (chrome://tracing, Perfetto)."""
+    with _lock:
+        spans = list(_spans)
+    events = [
+        {
+            "name": name,
+            "ph": "X",
+            "ts": (start - _started_at) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": 1,
+            "tid": thread,
+        }
+        for name, start, end, thread in spans
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
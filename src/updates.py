@@ -0,0 +1,231 @@
+import asyncio
+
+from asana.rest import ApiException
+
+import src.aio
+import src.api
+import src.cache
+import src.config
+import src.notes
+import src.ratelimit
+
+# Asana's batch API accepts at most 10 actions per request
+BATCH_SIZE = 10
+# What a write asks back: the name to report, and the version it made
+RESPONSE_FIELDS = ["name", "modified_at"]
+
+# For each project, the notes that changes to it are made to, and the notes
+# and modified_at it had when last read or written. The two differ after a
+# change was merged with someone else's, because the merged notes aren't
+# handed back to whoever made the change. Writing notes first checks nobody
+# else has changed them since.
+_versions: dict[str, tuple[str, str, str]] = {}
+# The notes of a change before it was merged, until the merged notes are written
+_merged_from: dict[str, str] = {}
+
+
+def remember(project: dict):
+    """Note the version of a project's notes that changes will be made to."""
+    if project.get("notes") is None or not project.get("modified_at"):
+        return
+    known = _versions.get(project["gid"])
+    if known and known[2] == project["modified_at"]:
+        # Nothing changed, and changes may still be made to unmerged notes
+        return
+    _versions[project["gid"]] = (
+        project["notes"],
+        project["notes"],
+        project["modified_at"],
+    )
+
+
+def wrote(project_gid: str, fields: dict, api_response):
+    """Move a project's version on to the one just written."""
+    based_on = _merged_from.pop(project_gid, None)
+    if not isinstance(api_response, dict) or not api_response.get("modified_at"):
+        return
+    notes = fields.get("notes")
+    if notes is None:
+        if project_gid not in _versions:
+            return
+        based_on, notes, _ = _versions[project_gid]
+    _versions[project_gid] = (
+        based_on or notes,
+        notes,
+        api_response["modified_at"],
+    )
+
+
+async def reconcile(pending: dict[str, dict]) -> list[str]:
+    """Redo notes changes on top of whatever was written since they were read.
+
+    Only the name and modified_at of each project are fetched to check. The
+    notes of those that changed are fetched again, and the change from what
+    was read is merged into them. A change that can't be merged isn't written, and
+    nor is anything else pending for the project; those projects are
+    returned.
+    """
+    for gid in pending:
+        _merged_from.pop(gid, None)
+    read = {
+        gid: _versions[gid]
+        for gid, fields in pending.items()
+        if "notes" in fields and gid in _versions
+    }
+    if not read:
+        return []
+    current = await src.aio.get_projects(list(read), "name,modified_at")
+    names = {
+        gid: project["name"].strip() if project else gid
+        for gid, project in zip(read, current)
+    }
+    changed = [
+        gid
+        for gid, project in zip(read, current)
+        if project and project["modified_at"] != read[gid][2]
+    ]
+    theirs = {gid: notes for gid, (_, notes, _) in read.items()}
+    if changed:
+        fresh = await src.aio.get_projects(changed, "notes,modified_at")
+        for gid, project in zip(changed, fresh):
+            if project is not None:
+                theirs[gid] = project["notes"]
+
+    conflicts = []
+    for gid, (based_on, _, _) in read.items():
+        if theirs[gid] == based_on:
+            continue
+        ours = pending[gid]["notes"]
+        merged = src.notes.merge(based_on, ours, theirs[gid])
+        name = names[gid]
+        if merged is None:
+            print(
+                f"Someone else changed the same lines of {name}'s notes, "
+                "so your changes to it weren't saved. Check the project and "
+                "try again."
+            )
+            pending[gid].clear()
+            conflicts.append(gid)
+        else:
+            if gid in changed:
+                print(f"Merged your note with changes someone else made to {name}.")
+            pending[gid]["notes"] = merged
+            _merged_from[gid] = ours
+    return conflicts
+
+
+class UpdateQueue:
+    """Collects project changes so each project is written in one request.
+
+    Setting the notes and then the color of a project results in a single
+    update, and flushing many projects at once goes through the batch API.
+    Pending changes are flushed when the queue is used as a context manager.
+    """
+
+    def __init__(self):
+        self._pending: dict[str, dict] = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def set_notes(self, project_gid: str, notes: str):
+        self._pending.setdefault(project_gid, {})["notes"] = notes
+
+    def set_color(self, project_gid: str, color: str):
+        self._pending.setdefault(project_gid, {})["color"] = color
+
+    def flush(self) -> list[str]:
+        """Send the pending changes, and return the projects that failed.
+
+        Batches of many projects are sent at the same time. A single change
+        queued on an active WritePipeline is reported when it's sent instead.
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return []
+        if len(pending) == 1:
+            # update_project checks its notes for changes itself
+            [(project_gid, fields)] = pending.items()
+            if src.api.update_project(project_gid, fields) is False:
+                return [project_gid]
+            return []
+        try:
+            failed = src.aio.run(reconcile(pending))
+        except ApiException as e:
+            print("Exception when checking projects for changes: %s\n" % e)
+            return list(pending)
+        items = [(gid, fields) for gid, fields in pending.items() if fields]
+        batches = [
+            items[start : start + BATCH_SIZE]
+            for start in range(0, len(items), BATCH_SIZE)
+        ]
+        if len(batches) == 1:
+            return failed + _send_batch(batches[0])
+        return failed + src.aio.run(_send_batches(batches))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+async def _send_batches(batches: list[list[tuple[str, dict]]]) -> list[str]:
+    failed = await asyncio.gather(
+        *(asyncio.to_thread(_send_batch, batch) for batch in batches)
+    )
+    return [project_gid for batch in failed for project_gid in batch]
+
+
+def _send_batch(items: list[tuple[str, dict]], attempt: int = 0) -> list[str]:
+    body = {
+        "data": {
+            "actions": [
+                {
+                    "relative_path": f"/projects/{project_gid}",
+                    "method": "put",
+                    "data": fields,
+                    "options": {"fields": RESPONSE_FIELDS},
+                }
+                for project_gid, fields in items
+            ]
+        }
+    }
+    try:
+        # Asana counts every action in a batch against the rate limit
+        api_response = src.ratelimit.call(
+            src.config.batch_api_instance.create_batch_request,
+            body,
+            {},
+            full_payload=True,
+            cost=len(items),
+        )
+    except ApiException as e:
+        print("Exception when calling BatchAPIApi->create_batch_request: %s\n" % e)
+        return [project_gid for project_gid, _ in items]
+    failed = []
+    retry = []
+    for (project_gid, fields), result in zip(items, api_response["data"]):
+        src.cache.invalidate(project_gid)
+        if result["status_code"] in src.ratelimit.RETRY_STATUSES:
+            retry.append((project_gid, fields, result))
+        elif result["status_code"] >= 400:
+            print(f"Exception when updating project {project_gid}: {result['body']}\n")
+            failed.append(project_gid)
+        else:
+            wrote(project_gid, fields, result["body"].get("data"))
+            src.api.report_update(result["body"].get("data"), fields)
+    if not retry:
+        return failed
+    # Actions that were rate limited or failed transiently are sent again
+    result = max(retry, key=lambda item: item[2]["status_code"] == 429)[2]
+    if src.ratelimit.scheduler().retry(
+        result["status_code"], result.get("headers"), attempt
+    ):
+        return failed + _send_batch(
+            [(gid, fields) for gid, fields, _ in retry], attempt + 1
+        )
+    for project_gid, _, result in retry:
+        print(f"Exception when updating project {project_gid}: {result['body']}\n")
+        failed.append(project_gid)
+    return failed
@@ -1,14 +1,20 @@
 import os
-import re
+import queue
 import sys
+import threading
+from concurrent.futures import Future, as_completed
 from datetime import datetime, timedelta
 
+from asana.rest import ApiException
 from colored import Fore, Style, fg, stylize
 
 import src.api
+import src.checkers
 import src.config
+import src.notes
+import src.timing
+import src.updates
 import src.utils
-import src.websites
 
 
 def print_project(
@@ -39,63 +45,118 @@ def print_project(
             )
         print_str.append(notes_str)
 
-    count_str = f"\n({count[0]}/{count[1]})\n" if count else ""
+    count_str = f"\n({'/'.join(map(str, count))})\n" if count else ""
     print(f"{count_str}" + "\n".join(print_str))
 
 
-def add_to_notes(new_text, current_notes, project_gid, with_initials=False):
+def prefetch(items, prepare, ahead: int):
+    """Yield prepare(item) for each item, in order.
+
+    A background thread keeps up to `ahead` prepared items waiting, so slow
+    preparation overlaps with whatever the caller does with each result.
+    """
+    prepared = queue.Queue(maxsize=ahead)
+    done = object()
+
+    def produce():
+        try:
+            for item in items:
+                prepared.put(prepare(item))
+        except Exception as e:
+            prepared.put(e)
+        prepared.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while (result := prepared.get()) is not done:
+        if isinstance(result, Exception):
+            raise result
+        yield result
+
+
+def add_to_notes(
+    new_text, current_notes, project_gid, with_initials=False, updates=None
+):
     today_str = datetime.now().strftime("%m/%d")
     new_text = today_str + " " + str(new_text)
     if with_initials:
         new_text += f" {'///' if src.config.ADMIN_MODE else ''}{src.config.INITIALS}"
-    src.api.replace_notes(new_text + "\n" + current_notes, project_gid)
+    new_notes = new_text + "\n" + current_notes
+    if updates is None:
+        src.api.replace_notes(new_notes, project_gid)
+    else:
+        updates.set_notes(project_gid, new_notes)
+    return new_notes
 
 
 def replace_link(body, link):
     return body.replace(link, link + " - DONE", 1)
 
 
-def multiple_questionnaires(data):
-    sr = input("Self-Report Link: ")
-    pg = input("Parent/Guardian Link: ")
+def multiple_questionnaires(data, sr=None, pg=None, updates=None):
+    if sr is None:
+        sr = src.timing.prompt("Self-Report Link: ")
+    if pg is None:
+        pg = src.timing.prompt("Parent/Guardian Link: ")
     message = f"{sr} - Self-Report - {src.config.INITIALS}\n{pg} - Parent/Guardian - {src.config.INITIALS}"
-    add_to_notes(
+    data["notes"] = add_to_notes(
         message,
         data["notes"],
         data["gid"],
+        updates=updates,
     )
     print(f"Send this message to {data['name']}:\n{message}")
 
 
-def generate_warning(data):
+def generate_warning(data, updates=None):
     COMPANY_NAME = os.getenv("COMPANY_NAME")
     deadline = (datetime.now() + timedelta(days=7)).strftime("%m/%d")
     message = f"This is {COMPANY_NAME}. This will be our last attempt to reach you. We have left you multiple messages. You have outstanding paperwork to do so that we may begin the evaluation process. If we don't hear from you by {deadline}, we will close this referral. Thank you."
-    add_to_notes(
+    data["notes"] = add_to_notes(
         "lw " + src.config.INITIALS + " " + deadline,
         data["notes"],
         data["gid"],
+        updates=updates,
     )
     print(f"Send this message to {data['name']}:\n{message}")
 
 
-def mark_links(data, allowed_domains, links: list[str]):
+def hold_date(text: str) -> str | None:
+    """The MM/DD a hold of text (days, or a MM/DD date) lasts until."""
+    if "/" in text:
+        return text
+    try:
+        days = int(text)
+    except ValueError:
+        return None
+    return (datetime.now() + timedelta(days=days)).strftime("%m/%d")
+
+
+def mark_links(
+    data,
+    allowed_domains,
+    links: list[str],
+    updates: "src.updates.UpdateQueue | None" = None,
+):
+    if updates is None:
+        with src.updates.UpdateQueue() as updates:
+            return mark_links(data, allowed_domains, links, updates)
+
     if len(links) == 1:
         new_body = replace_link(data["notes"], links[0])
-        src.api.replace_notes(new_body, data["gid"])
+        updates.set_notes(data["gid"], new_body)
     else:
         print("Which link to mark as completed?")
         for i, link in enumerate(links):
             print(f"{i+1}. {link}")
         while True:
-            choice = input(
+            choice = src.timing.prompt(
                 "Enter the numbers of the links to mark (space separated), or 'all' to mark all: "
             )
             if choice.lower() == "all":
                 new_body = data["notes"]
                 for link in links:
                     new_body = replace_link(new_body, link)
-                src.api.replace_notes(new_body, data["gid"])
+                updates.set_notes(data["gid"], new_body)
                 break
             else:
                 try:
@@ -105,26 +166,21 @@ def mark_links(data, allowed_domains, links: list[str]):
                         for choice in choices:
                             chosen_link = links[choice - 1]
                             new_body = replace_link(new_body, chosen_link)
-                        src.api.replace_notes(new_body, data["gid"])
+                        updates.set_notes(data["gid"], new_body)
                         break
                     else:
                         print("Invalid choice.")
                 except ValueError:
                     print("Invalid input.")
-    new_links = [
-        link
-        for link in re.findall(r"(https?://\S+[\s\S]*?)(?=\n|$)", new_body)
-        if " - DONE" not in link and any(domain in link for domain in allowed_domains)
-    ]
-    if not new_links:
-        src.api.change_color("light-purple", data["gid"])
+    if not src.notes.parse(new_body, domains=allowed_domains).open_links:
+        updates.set_color(data["gid"], "light-purple")
         return True
     return new_body
 
 
 def get_expired(data):
     if data["warning_on_top"]:
-        first_line = data["notes"].splitlines()[0]
+        first_line = src.notes.state_of(data).first_line
         last_word = first_line.split()[-1]
         try:
             current_month = datetime.now().month
@@ -139,23 +195,64 @@ def get_expired(data):
             pass
 
 
-def mark_done_links():
+def mark_done_links(workers: int = 1):
     src.config.get_consts()
-    projects = src.api.get_asana_tasks_by_color()
-    driver = src.websites.create_driver()
-    for project in projects:  # pyright: ignore
-        links = [
-            link
-            for link in re.findall(r"(https?://\S+[\s\S]*?)(?=\n|$)", project["notes"])
-            if " - DONE" not in link
-            and any(domain in link for domain in src.config.allowed_domains)
-        ]
-        for link in links:
+    if workers > src.checkers.MAX_PER_DOMAIN:
+        print(
+            f"Checking up to {src.checkers.MAX_PER_DOMAIN} links at once for "
+            "each site, so as not to overload it."
+        )
+    projects = src.api.iter_tasks_by_color()
+    with (
+        src.checkers.LinkChecker(workers) as link_checker,
+        src.updates.UpdateQueue() as updates,
+    ):
+        # Queue each check as its project comes in, then walk the results in
+        # project order so the output stays grouped no matter which checks
+        # finish first.
+        pending = []
+        try:
+            for project in projects:
+                checks = [
+                    (link, link_checker.submit(link))
+                    for link in src.notes.state_of(project).open_links
+                ]
+                pending.append((project, checks))
+        except ApiException as e:
+            print("Exception when fetching projects: %s\n" % e)
+            print(f"Only checking the links of the first {len(pending)} projects.")
+
+        for project, checks in pending:
             name = project["name"].strip()
-            done = src.websites.check_q_done(driver, link, name)
-            if done:
-                mark_links(project, src.config.allowed_domains, [link])
-    driver.quit()
+            for link, check in checks:
+                if not check.result():
+                    print(f"Not done: {link} from {name}")
+                    continue
+                print(f"Done: {link} from {name}")
+                new_body = mark_links(
+                    project, src.config.allowed_domains, [link], updates
+                )
+                if isinstance(new_body, str):
+                    project["notes"] = new_body
+            if len(updates) >= src.updates.BATCH_SIZE:
+                updates.flush()
+
+
+def print_link_checks(checks: dict[str, Future[bool]]) -> list[str]:
+    """Print whether each link is done as soon as its check finishes.
+
+    Returns the links that are done.
+    """
+    print("Checking links...")
+    links = {check: link for link, check in checks.items()}
+    done = []
+    for check in as_completed(links):
+        if check.result():
+            print(stylize(f"Done: {links[check]}", fg("green")))
+            done.append(links[check])
+        else:
+            print(f"Not done: {links[check]}")
+    return done
 
 
 def what_to_do(
@@ -163,29 +260,31 @@ def what_to_do(
     count: list[int] | None = None,
     fields: list[str] = ["name", "link", "notes"],
     source: str | None = None,
+    link_checker: "src.checkers.LinkChecker | None" = None,
+    link_checks: dict[str, Future[bool]] | None = None,
 ):
-    body = data["notes"]
-    allowed_domains = ["mhs.com", "pearsonassessments.com"]
+    if link_checker is None and not src.config.ADMIN_MODE:
+        # Links nobody checked yet are checked a few at a time for each site
+        with src.checkers.LinkChecker(src.checkers.MAX_PER_DOMAIN) as link_checker:
+            return what_to_do(data, count, fields, source, link_checker, link_checks)
+
+    allowed_domains = src.config.allowed_domains
+    print_project(data, count, fields)
+
     links = []
     if not src.config.ADMIN_MODE:
-        driver = src.websites.create_driver()
-        links = [
-            link
-            for link in re.findall(r"(https?://\S+[\s\S]*?)(?=\n|$)", body)
-            if " - DONE" not in link
-            and any(domain in link for domain in allowed_domains)
-        ]
-        for link in links:
-            done = src.websites.check_q_done(driver, link, data["name"])
-            if done:
-                no_more_links = mark_links(data, allowed_domains, [link])
-                if no_more_links is True:
-                    return
-                else:
+        checks = {
+            link: (link_checks or {}).get(link) or link_checker.submit(link)
+            for link in src.notes.state_of(data).open_links
+        }
+        if checks:
+            with src.updates.UpdateQueue() as updates:
+                for link in print_link_checks(checks):
+                    no_more_links = mark_links(data, allowed_domains, [link], updates)
+                    if no_more_links is True:
+                        return
                     data["notes"] = no_more_links
-        driver.quit()
-
-    print_project(data, count, fields)
+        links = src.notes.state_of(data).open_links
     print("a <note> ".ljust(20) + "Add a note with the date")
     print(
         "h <days or date> ".ljust(20)
@@ -215,11 +314,12 @@ def what_to_do(
         elif messages_left == 0 and not data["warning_on_top"]:
             print(stylize("It's time to send the final warning.", fg("red")))
 
-    command = input("What's new? ")
+    command = src.timing.prompt("What's new? ")
 
     if command.startswith("a "):
         additional_text = command[2:].strip()
-        add_to_notes(additional_text, data["notes"], data["gid"], True)
+        updates = src.updates.UpdateQueue()
+        add_to_notes(additional_text, data["notes"], data["gid"], True, updates)
         if src.config.ADMIN_MODE:
             if source == "search":
                 print("Select a color:")
@@ -237,28 +337,22 @@ def what_to_do(
                 print(f"<Enter> - No change (currently {current_color})")
                 print("1 - Purple")
                 print("2 - Pink")
-                color = input("Color to change to: ")
+                color = src.timing.prompt("Color to change to: ")
 
                 if color == "1":
-                    src.api.change_color("light-purple", data["gid"])
+                    updates.set_color(data["gid"], "light-purple")
                 elif color == "2":
-                    src.api.change_color("dark-pink", data["gid"])
+                    updates.set_color(data["gid"], "dark-pink")
             else:
-                src.api.change_color("light-purple", data["gid"])
+                updates.set_color(data["gid"], "light-purple")
+        updates.flush()
     elif command.startswith("h "):
-        hold_date = None
-        additional_text = command[2:].strip()
-        if "/" in additional_text:
-            hold_date = additional_text
+        until = hold_date(command[2:].strip())
+        if until is None:
+            print("Invalid input.")
+            what_to_do(data, link_checker=link_checker, link_checks=link_checks)
         else:
-            try:
-                days = int(additional_text)
-                hold_date = (datetime.now() + timedelta(days=days)).strftime("%m/%d")
-            except ValueError:
-                print("Invalid input.")
-                what_to_do(data)
-        if hold_date is not None:
-            add_to_notes("hold " + hold_date, data["notes"], data["gid"], True)
+            add_to_notes("hold " + until, data["notes"], data["gid"], True)
     elif command == "s":
         pass
     elif not src.config.ADMIN_MODE:
@@ -272,4 +366,4 @@ def what_to_do(
             mark_links(data, allowed_domains, links)
         else:
             print("Invalid command.")
-            what_to_do(data)
+            what_to_do(data, link_checker=link_checker, link_checks=link_checks)
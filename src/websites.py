@@ -1,3 +1,5 @@
+import json
+import os
 import time
 from datetime import datetime
 from os import getenv
@@ -5,138 +7,320 @@ from os import getenv
 from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import Select
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import Select, WebDriverWait
 
-load_dotenv()
+import src.config
+import src.timing
 
+load_dotenv()
 
-def create_driver():
+# How long to wait for a page to get where we need it before giving up
+WAIT_TIMEOUT = 20
+
+TA_URL = "https://portal.therapyappointment.com"
+MHS_URL = "https://assess.mhs.com"
+TA_CLIENTS = "//*[contains(text(), 'Clients')]"
+MHS_ASSESSMENTS = "//span[contains(normalize-space(text()), 'My Assessments')]"
+
+# True once the page has loaded and no AJAX request or ASP.NET partial
+# postback (which MHS uses to fill in its dropdowns) is in flight
+PAGE_IDLE = """
+return document.readyState === "complete"
+    && !(window.jQuery && window.jQuery.active)
+    && !(window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager
+         && Sys.WebForms.PageRequestManager.getInstance().get_isInAsyncPostBack());
+"""
+
+
+# What the headless profile doesn't load: images, stylesheets and fonts
+BLOCKED_URLS = [
+    f"*.{extension}"
+    for extension in [
+        "png", "jpg", "jpeg", "gif", "svg", "webp", "ico",
+        "css",
+        "woff", "woff2", "ttf", "otf", "eot",
+    ]
+]  # fmt: skip
+
+
+@src.timing.timed("chrome.start")
+def create_driver(profile: str = "interactive"):
+    """Start Chrome with one of two profiles.
+
+    "interactive" is a maximized window someone can watch and take over.
+    "headless" has no window, extensions, images, stylesheets or fonts, and
+    counts a page as loaded once its HTML is parsed, for checks nobody watches.
+    """
     options = webdriver.ChromeOptions()
-    options.add_argument("--start-maximized")
-    # options.add_argument("--headless=new")
+    if profile == "headless":
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1280,800")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.page_load_strategy = "eager"
+    elif profile == "interactive":
+        options.add_argument("--start-maximized")
+    else:
+        raise ValueError(f"Unknown driver profile: {profile}")
+    # No implicit wait: everything that has to wait for the page says what
+    # it's waiting for through the helpers below
     driver = webdriver.Chrome(options=options)
-    driver.implicitly_wait(30)
+    if profile == "headless":
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
     return driver
 
 
-def check_q_done(driver: webdriver.Chrome, q_link: str, name: str):
-    driver.implicitly_wait(5)
-    print(f"Checking {q_link} from {name}...")
-    url = q_link.split(" ")[0]
+class DriverSession:
+    """Starts Chrome on first use and keeps reusing it until closed.
+
+    profile is passed on to create_driver.
+    """
+
+    def __init__(self, profile: str = "interactive"):
+        self.profile = profile
+        self._driver = None
+
+    @property
+    def driver(self) -> webdriver.Chrome:
+        if self._driver is None:
+            self._driver = create_driver(self.profile)
+        return self._driver
+
+    def close(self):
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def until(driver: webdriver.Chrome, condition, timeout: float = WAIT_TIMEOUT):
+    """Wait for condition(driver) to return something truthy, and return it."""
+    with src.timing.span("websites.wait"):
+        return WebDriverWait(
+            driver,
+            timeout,
+            poll_frequency=0.1,
+            ignored_exceptions=(NoSuchElementException, StaleElementReferenceException),
+        ).until(condition)
+
+
+def page_idle(driver: webdriver.Chrome) -> bool:
+    return driver.execute_script(PAGE_IDLE)
+
+
+def find(
+    driver: webdriver.Chrome, by: str, value: str, timeout: float = WAIT_TIMEOUT
+) -> WebElement:
+    """Wait for an element to be on the page."""
+    return until(driver, EC.presence_of_element_located((by, value)), timeout)
+
+
+def click(driver: webdriver.Chrome, by: str, value: str):
+    """Wait for an element to be clickable, then click it."""
+    until(driver, EC.element_to_be_clickable((by, value))).click()
+
+
+def submit(driver: webdriver.Chrome, by: str, value: str):
+    """Click a button that loads a new page, and wait for that page to load.
+
+    Pages that follow one another often have a button matching the same
+    selector, so the old one has to be gone before looking for the next.
+    """
+    button = until(driver, EC.element_to_be_clickable((by, value)))
+    button.click()
+    until(driver, EC.staleness_of(button))
+    until(driver, page_idle)
+
+
+def select(driver: webdriver.Chrome, element_id: str, text: str, index: int = 0):
+    """Choose text in the index-th dropdown with element_id once it's offered.
+
+    MHS only fills in a dropdown after the one before it has changed, and
+    redraws them when it does, so this keeps choosing until the page is idle
+    with text still chosen.
+    """
+
+    def chosen(driver):
+        if not page_idle(driver):
+            return False
+        elements = driver.find_elements(By.ID, element_id)
+        if len(elements) <= index:
+            return False
+        dropdown = Select(elements[index])
+        if dropdown.first_selected_option.text.strip() == text:
+            return True
+        dropdown.select_by_visible_text(text)
+        return False
+
+    until(driver, chosen)
+
+
+def link_box_values(driver: webdriver.Chrome) -> list[str]:
+    """Wait for the generated questionnaire links and return them."""
+
+    def values(driver):
+        boxes = driver.find_elements(By.CLASS_NAME, "txtLinkBox")
+        links = [box.get_attribute("value") for box in boxes]
+        return links if links and all(links) else None
+
+    return until(driver, values)
+
+
+@src.timing.timed("browser.page_load")
+def page_has_text(driver: webdriver.Chrome, url: str, text: str):
     driver.get(url)
+    try:
+        find(driver, By.XPATH, f"//*[contains(text(), '{text}')]", timeout=5)
+        return True
+    except TimeoutException:
+        return False
 
-    complete = False
 
-    if "mhs.com" in url:
-        try:
-            driver.find_element(
-                By.XPATH, "//*[contains(text(), 'Thank you for completing')]"
-            )
-            complete = True
-        except NoSuchElementException:
-            complete = False
-    elif "pearsonassessments.com" in url:
-        try:
-            driver.find_element(By.XPATH, "//*[contains(text(), 'Test Completed!')]")
-            complete = True
-        except NoSuchElementException:
-            complete = False
+def save_session(driver: webdriver.Chrome, site: str):
+    """Keep the cookies of a logged in site for the next run.
+
+    They're as good as a password while they last, so only the user can
+    read them.
+    """
+    src.config.SESSIONS_PATH.mkdir(parents=True, exist_ok=True, mode=0o700)
+    path = src.config.SESSIONS_PATH / f"{site}.json"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, "w") as f:
+        json.dump(driver.get_cookies(), f)
 
-    return complete
+
+def restore_session(driver: webdriver.Chrome, site: str):
+    """Give the browser the cookies saved by save_session, if any."""
+    path = src.config.SESSIONS_PATH / f"{site}.json"
+    try:
+        with open(path) as f:
+            cookies = json.load(f)
+    except (OSError, ValueError):
+        return
+    # Through DevTools the cookies can be set without loading the site first
+    for cookie in cookies:
+        if "expiry" in cookie:
+            cookie["expires"] = cookie.pop("expiry")
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+
+def logged_in(
+    driver: webdriver.Chrome, site: str, url: str, marker: str, login_field: str
+) -> bool:
+    """Load url with the saved session and see if it's still logged in.
+
+    marker is an XPath to something only shown once logged in, login_field
+    the name of an input only shown on the login form.
+    """
+    with src.timing.span("websites.restore_session"):
+        restore_session(driver, site)
+        driver.get(url)
+        try:
+            page = find(driver, By.XPATH, f"{marker} | //input[@name='{login_field}']")
+        except TimeoutException:
+            return False
+        return page.tag_name != "input"
 
 
 def log_in_ta(driver: webdriver.Chrome):
-    driver.get("https://portal.therapyappointment.com")
+    if logged_in(driver, "ta", TA_URL, TA_CLIENTS, "user_username"):
+        return
+    driver.get(TA_URL)
 
     username = getenv("TA_USERNAME")
     if username is None:
         raise ValueError("TA_USERNAME environment variable must be set")
-    username_field = driver.find_element(By.NAME, "user_username")
+    username_field = find(driver, By.NAME, "user_username")
     username_field.send_keys(username)
 
     password = getenv("TA_PASSWORD")
     if password is None:
         raise ValueError("TA_PASSWORD environment variable must be set")
-    password_field = driver.find_element(By.NAME, "user_password")
+    password_field = find(driver, By.NAME, "user_password")
     password_field.send_keys(password)
 
-    submit_button = driver.find_element(
-        by=By.CSS_SELECTOR, value="button[type='submit']"
-    )
-    submit_button.click()
+    click(driver, By.CSS_SELECTOR, "button[type='submit']")
+    find(driver, By.XPATH, TA_CLIENTS)
+    save_session(driver, "ta")
 
 
 def go_to_client(driver: webdriver.Chrome, firstname: str, lastname: str):
-    clients_button = driver.find_element(
-        by=By.XPATH, value="//*[contains(text(), 'Clients')]"
-    )
-    clients_button.click()
+    click(driver, By.XPATH, TA_CLIENTS)
 
-    firstname_label = driver.find_element(By.XPATH, "//label[text()='First Name']")
+    firstname_label = find(driver, By.XPATH, "//label[text()='First Name']")
     firstname_field = firstname_label.find_element(
         By.XPATH, "./following-sibling::input"
     )
     firstname_field.send_keys(firstname)
 
-    lastname_label = driver.find_element(By.XPATH, "//label[text()='Last Name']")
+    lastname_label = find(driver, By.XPATH, "//label[text()='Last Name']")
     lastname_field = lastname_label.find_element(By.XPATH, "./following-sibling::input")
     lastname_field.send_keys(lastname)
 
-    search_button = driver.find_element(By.CSS_SELECTOR, "button[aria-label='Search'")
-    time.sleep(1)
-    search_button.click()
+    click(driver, By.CSS_SELECTOR, "button[aria-label='Search']")
 
-    driver.find_element(
-        By.CSS_SELECTOR, "a[aria-description*='Press Enter to view the profile of"
-    ).click()
+    search_url = driver.current_url
+    click(
+        driver,
+        By.CSS_SELECTOR,
+        "a[aria-description*='Press Enter to view the profile of']",
+    )
+    until(driver, EC.url_changes(search_url))
 
     return driver.current_url
 
 
 def check_if_opened_portal(driver: webdriver.Chrome):
     try:
-        driver.find_element(By.CSS_SELECTOR, "input[aria-checked='true']")
+        find(driver, By.CSS_SELECTOR, "input[aria-checked='true']", timeout=5)
         return True
-    except NoSuchElementException:
+    except TimeoutException:
         return False
 
 
 def check_if_docs_signed(driver: webdriver.Chrome):
+    completed = "//div[contains(normalize-space(text()), 'has completed registration')]"
+    not_completed = (
+        "//div[contains(normalize-space(text()), 'has not completed registration')]"
+    )
     try:
-        driver.implicitly_wait(5)
-        driver.find_element(
-            By.XPATH,
-            "//div[contains(normalize-space(text()), 'has completed registration')]",
-        )
-        return True
-    except NoSuchElementException:
-        try:
-            driver.find_element(
-                By.XPATH,
-                "//div[contains(normalize-space(text()), 'has not completed registration')]",
-            )
-            return False
-        except NoSuchElementException:
-            return "not found"
+        element = find(driver, By.XPATH, f"{completed} | {not_completed}", timeout=5)
+    except TimeoutException:
+        return "not found"
+    return "has not completed" not in element.text
 
 
 def extract_client_data(driver: webdriver.Chrome, client_url: str):
     driver.get(client_url)
-    name = driver.find_element(By.CLASS_NAME, "text-h4").text
+    name = find(driver, By.CLASS_NAME, "text-h4").text
     firstname = name.split(" ")[0]
     lastname = name.split(" ")[-1]
-    account_number_element = driver.find_element(
-        By.XPATH, "//div[contains(normalize-space(text()), 'Account #')]"
+    account_number_element = find(
+        driver, By.XPATH, "//div[contains(normalize-space(text()), 'Account #')]"
     ).text
     account_number = account_number_element.split(" ")[-1]
-    birthdate_element = driver.find_element(
-        By.XPATH, "//div[contains(normalize-space(text()), 'DOB ')]"
+    birthdate_element = find(
+        driver, By.XPATH, "//div[contains(normalize-space(text()), 'DOB ')]"
     ).text
     birthdate_str = birthdate_element.split(" ")[-1]
     birthdate = time.strftime("%Y/%m/%d", time.strptime(birthdate_str, "%m/%d/%Y"))
-    gender_title_element = driver.find_element(
+    gender_title_element = find(
+        driver,
         By.XPATH,
         "//div[contains(normalize-space(text()), 'Gender') and contains(@class, 'v-list-item__title')]",
     )
@@ -144,9 +328,8 @@ def extract_client_data(driver: webdriver.Chrome, client_url: str):
     gender_element = gender_title_element.find_element(
         By.XPATH, "following-sibling::div"
     )
-    # IDK why but we have to wait before getting the gender text specifically
-    time.sleep(0.5)
-    gender = gender_element.text.split(" ")[0]
+    # The gender is filled in after the rest of the profile
+    gender = until(driver, lambda driver: gender_element.text).split(" ")[0]
 
     age = relativedelta(datetime.now(), datetime.strptime(birthdate, "%Y/%m/%d")).years
     return {
@@ -160,22 +343,34 @@ def extract_client_data(driver: webdriver.Chrome, client_url: str):
 
 
 def log_in_mhs(driver: webdriver.Chrome):
+    if logged_in(driver, "mhs", MHS_URL, MHS_ASSESSMENTS, "txtUsername"):
+        return
     driver.get("https://assess.mhs.com/Account/Login.aspx")
 
     username = getenv("MHS_USERNAME")
     if username is None:
         raise ValueError("MHS_USERNAME environment variable must be set")
-    username_field = driver.find_element(By.NAME, "txtUsername")
+    username_field = find(driver, By.NAME, "txtUsername")
     username_field.send_keys(username)
 
     password = getenv("MHS_PASSWORD")
     if password is None:
         raise ValueError("MHS_PASSWORD environment variable must be set")
-    password_field = driver.find_element(By.NAME, "txtPassword")
+    password_field = find(driver, By.NAME, "txtPassword")
     password_field.send_keys(password)
 
-    sign_in_button = driver.find_element(By.NAME, "cmdLogin")
-    sign_in_button.click()
+    click(driver, By.NAME, "cmdLogin")
+    find(driver, By.XPATH, MHS_ASSESSMENTS)
+    save_session(driver, "mhs")
+
+
+def open_assessment(driver: webdriver.Chrome, Q: str):
+    """Go to the Email Invitation page of assessment Q."""
+    click(driver, By.XPATH, MHS_ASSESSMENTS)
+    click(driver, By.XPATH, f"//span[contains(normalize-space(text()), '{Q}')]")
+    click(
+        driver, By.XPATH, "//div[contains(normalize-space(text()), 'Email Invitation')]"
+    )
 
 
 def add_client_to_mhs(driver: webdriver.Chrome, client: dict, Q: str):
@@ -184,38 +379,35 @@ def add_client_to_mhs(driver: webdriver.Chrome, client: dict, Q: str):
     id = client["account_number"]
     dob = client["birthdate"]
     gender = client["gender"]
-    driver.find_element(
-        By.XPATH, "//div[@class='pull-right']//input[@type='submit']"
-    ).click()
+    click(driver, By.XPATH, "//div[@class='pull-right']//input[@type='submit']")
 
-    firstname_label = driver.find_element(By.XPATH, "//label[text()='FIRST NAME']")
+    firstname_label = find(driver, By.XPATH, "//label[text()='FIRST NAME']")
     firstname_field = firstname_label.find_element(
         By.XPATH, "./following-sibling::input"
     )
     firstname_field.send_keys(firstname)
 
-    lastname_label = driver.find_element(By.XPATH, "//label[text()='LAST NAME']")
+    lastname_label = find(driver, By.XPATH, "//label[text()='LAST NAME']")
     lastname_field = lastname_label.find_element(By.XPATH, "./following-sibling::input")
     lastname_field.send_keys(lastname)
 
-    id_label = driver.find_element(By.XPATH, "//label[text()='ID']")
+    id_label = find(driver, By.XPATH, "//label[text()='ID']")
     id_field = id_label.find_element(By.XPATH, "./following-sibling::input")
     id_field.send_keys(id)
 
-    date_of_birth_field = driver.find_element(
-        By.CSS_SELECTOR, "input[placeholder='YYYY/Mmm/DD']"
+    date_of_birth_field = find(
+        driver, By.CSS_SELECTOR, "input[placeholder='YYYY/Mmm/DD']"
     )
     date_of_birth_field.send_keys(dob)
 
     if Q != "Conners 4":
-        male_label = driver.find_element(By.XPATH, "//label[text()='Male']")
-        female_label = driver.find_element(By.XPATH, "//label[text()='Female']")
         if gender == "Male":
-            male_label.click()
+            click(driver, By.XPATH, "//label[text()='Male']")
         else:
-            female_label.click()
+            click(driver, By.XPATH, "//label[text()='Female']")
     else:
-        gender_element = driver.find_element(
+        gender_element = find(
+            driver,
             By.CSS_SELECTOR,
             "select[aria-label*='Gender selection dropdown']",
         )
@@ -227,252 +419,189 @@ def add_client_to_mhs(driver: webdriver.Chrome, client: dict, Q: str):
         else:
             gender_select.select_by_visible_text("Other")
 
-    purpose_element = driver.find_element(
+    purpose_element = find(
+        driver,
         By.CSS_SELECTOR,
         "select[placeholder='Select an option']",
     )
     purpose = Select(purpose_element)
     purpose.select_by_visible_text("Psychoeducational Evaluation")
 
-    driver.find_element(By.CSS_SELECTOR, ".pull-right > input[type='submit']").click()
+    click(driver, By.CSS_SELECTOR, ".pull-right > input[type='submit']")
 
-    try:
-        driver.implicitly_wait(5)
-        error = driver.find_element(
-            By.XPATH,
-            "//span[contains(text(), 'A client with the same ID already exists')]",
-        )
-        if error:
-            print("A client with the same ID already exists")
-            if Q == "Conners 4":
-                # TODO: See if there's any way to automate this still :(
-                print(
-                    f"Manual intervention required for Conners 4: {client["firstname"]} {client["lastname"]}"
-                )
-                return False
-            driver.find_element(
-                By.XPATH, "//span[contains(normalize-space(text()), 'My Assessments')]"
-            ).click()
-
-            driver.find_element(
-                By.XPATH, f"//span[contains(normalize-space(text()), '{Q}')]"
-            ).click()
-
-            driver.find_element(
-                By.XPATH, "//div[contains(normalize-space(text()), 'Email Invitation')]"
-            ).click()
-            driver.find_element(
-                By.CSS_SELECTOR, "input[value='Search Client']"
-            ).send_keys(id)
-            time.sleep(1)
-            driver.find_element(
-                By.XPATH,
-                f"//li[contains(@class,'rsbListItem') and contains(text(), '{id}')]",
-            ).click()
-            time.sleep(1)
-            driver.find_element(By.CSS_SELECTOR, "input[type='submit']").click()
-            purpose_element = driver.find_element(By.CSS_SELECTOR, "select")
-            purpose = Select(purpose_element)
-            purpose.select_by_visible_text("Psychoeducational Evaluation")
-
-            driver.find_element(
-                By.CSS_SELECTOR, ".pull-right > input[type='submit']"
-            ).click()
-
-    except NoSuchElementException:
+    # Either MHS complains the client exists, or it moves on to the
+    # assessment details
+    exists_error = (
+        "//span[contains(text(), 'A client with the same ID already exists')]"
+    )
+    next_page = find(driver, By.XPATH, f"{exists_error} | //*[@id='ddl_Description']")
+    if next_page.tag_name != "span":
         print("New client created")
         return True
 
+    print("A client with the same ID already exists")
+    if Q == "Conners 4":
+        # TODO: See if there's any way to automate this still :(
+        print(
+            f"Manual intervention required for Conners 4: {client["firstname"]} {client["lastname"]}"
+        )
+        return False
+    open_assessment(driver, Q)
+    find(driver, By.CSS_SELECTOR, "input[value='Search Client']").send_keys(id)
+    click(
+        driver,
+        By.XPATH,
+        f"//li[contains(@class,'rsbListItem') and contains(text(), '{id}')]",
+    )
+    until(driver, page_idle)
+    submit(driver, By.CSS_SELECTOR, "input[type='submit']")
+    purpose_element = find(driver, By.CSS_SELECTOR, "select")
+    purpose = Select(purpose_element)
+    purpose.select_by_visible_text("Psychoeducational Evaluation")
 
-def gen_asrs(driver: webdriver.Chrome, client: dict):
-    driver.implicitly_wait(20)
-    driver.find_element(
-        By.XPATH, "//span[contains(normalize-space(text()), 'My Assessments')]"
-    ).click()
-    driver.find_element(
-        By.XPATH, "//span[contains(normalize-space(text()), 'ASRS')]"
-    ).click()
-    driver.find_element(
-        By.XPATH, "//div[contains(normalize-space(text()), 'Email Invitation')]"
-    ).click()
-
-    add_client_to_mhs(driver, client, "ASRS")
+    click(driver, By.CSS_SELECTOR, ".pull-right > input[type='submit']")
 
-    description_element = driver.find_element(By.ID, "ddl_Description")
-    description = Select(description_element)
 
-    if client["age"] < 18 and client["age"] >= 6:
-        description.select_by_visible_text("ASRS (6-18 Years)")
-    elif client["age"] < 6:
-        description.select_by_visible_text("ASRS (2-5 Years)")
+def choose_rater(
+    driver: webdriver.Chrome, description: str | None, rater: str, row: int = 0
+):
+    """Fill in one row of the assessment details."""
+    if description:
+        select(driver, "ddl_Description", description, row)
+    select(driver, "ddl_RaterType", rater, row)
+    select(driver, "ddl_Language", "English", row)
 
-    time.sleep(1.5)  # Rater field is very fussy
 
-    rater_element = driver.find_element(By.ID, "ddl_RaterType")
-    rater = Select(rater_element)
-    rater.select_by_visible_text("Parent")
+def gen_asrs(driver: webdriver.Chrome, client: dict):
+    open_assessment(driver, "ASRS")
 
-    time.sleep(1.5)
+    add_client_to_mhs(driver, client, "ASRS")
 
-    language_element = driver.find_element(By.ID, "ddl_Language")
-    language = Select(language_element)
-    language.select_by_visible_text("English")
+    description = None
+    if client["age"] < 18 and client["age"] >= 6:
+        description = "ASRS (6-18 Years)"
+    elif client["age"] < 6:
+        description = "ASRS (2-5 Years)"
+    choose_rater(driver, description, "Parent")
 
-    rater_name = driver.find_element(By.ID, "txtRaterName")
+    rater_name = find(driver, By.ID, "txtRaterName")
     rater_name.send_keys("Parent/Guardian")
 
-    driver.find_element(By.CSS_SELECTOR, ".pull-right > input[type='submit']").click()
-
-    time.sleep(1)
-
-    driver.find_element(By.CSS_SELECTOR, ".pull-right > input[type='submit']").click()
+    # Both steps have a button like this, so wait for the first to go away
+    submit(driver, By.CSS_SELECTOR, ".pull-right > input[type='submit']")
+    click(driver, By.CSS_SELECTOR, ".pull-right > input[type='submit']")
 
-    time.sleep(1)
-
-    q_link = driver.find_element(By.CLASS_NAME, "txtLinkBox").get_attribute("value")
+    q_link = link_box_values(driver)[0]
 
     return q_link
 
 
 def gen_conners(driver: webdriver.Chrome, client: dict):
-    driver.implicitly_wait(20)
-    driver.find_element(
-        By.XPATH, "//span[contains(normalize-space(text()), 'My Assessments')]"
-    ).click()
-    time.sleep(1)
     if client["age"] < 6:
         conners_ver = "Conners EC"
-        driver.find_element(
-            By.XPATH, "//span[contains(normalize-space(text()), 'Conners EC')]"
-        ).click()
     else:
         conners_ver = "Conners 4"
-        driver.find_element(
-            By.XPATH, "//span[contains(normalize-space(text()), 'Conners 4')]"
-        ).click()
-    driver.find_element(
-        By.XPATH, "//div[contains(normalize-space(text()), 'Email Invitation')]"
-    ).click()
+    open_assessment(driver, conners_ver)
 
     client_added = add_client_to_mhs(driver, client, conners_ver)
 
     if not client_added:
         print(client)
 
-    description_element = driver.find_element(By.ID, "ddl_Description")
-    description = Select(description_element)
-
-    if client["age"] < 6:
-        description.select_by_visible_text("Conners EC")
-    else:
-        description.select_by_visible_text("Conners 4")
-
-    time.sleep(1.5)  # Rater field is very fussy
-
-    rater_element = driver.find_element(By.ID, "ddl_RaterType")
-    rater = Select(rater_element)
-    rater.select_by_visible_text("Parent")
-
-    time.sleep(1.5)
+    choose_rater(driver, conners_ver, "Parent")
 
-    language_element = driver.find_element(By.ID, "ddl_Language")
-    language = Select(language_element)
-    language.select_by_visible_text("English")
-
-    rater_name = driver.find_element(By.ID, "txtRaterName")
+    rater_name = find(driver, By.ID, "txtRaterName")
     rater_name.send_keys("Parent/Guardian")
 
     if client["age"] > 9:
-        driver.find_element(By.ID, "btn_addRow").click()
-        time.sleep(1.5)
-        description_element = driver.find_elements(By.ID, "ddl_Description")[1]
-        description = Select(description_element)
-        description.select_by_visible_text("Conners 4")
-
-        time.sleep(1.5)  # Rater field is very fussy
-
-        rater_element = driver.find_elements(By.ID, "ddl_RaterType")[1]
-        rater = Select(rater_element)
-        rater.select_by_visible_text("Self-Report")
+        click(driver, By.ID, "btn_addRow")
+        choose_rater(driver, "Conners 4", "Self-Report", row=1)
 
-        time.sleep(1.5)
+    click(driver, By.ID, "_btnnext")
+    click(driver, By.ID, "btnGenerateLinks")
 
-        language_element = driver.find_elements(By.ID, "ddl_Language")[1]
-        language = Select(language_element)
-        language.select_by_visible_text("English")
-
-        driver.find_element(By.ID, "_btnnext").click()
-
-        time.sleep(1)
-
-        driver.find_element(By.ID, "btnGenerateLinks").click()
-
-        time.sleep(1)
-
-        q_link_els = driver.find_elements(By.CLASS_NAME, "txtLinkBox")
-        q_links = []
-        for link_el in q_link_els:
-            q_links.append(link_el.get_attribute("value"))
+    q_links = link_box_values(driver)
+    if client["age"] > 9:
         return q_links
-
-    driver.find_element(By.ID, "_btnnext").click()
-
-    time.sleep(1)
-
-    driver.find_element(By.ID, "btnGenerateLinks").click()
-
-    time.sleep(1)
-
-    q_link = driver.find_element(By.CLASS_NAME, "txtLinkBox").get_attribute("value")
-
-    return q_link
+    return q_links[0]
 
 
 def send_message_ta(driver: webdriver.Chrome, client_url: str, message: str):
     driver.get(client_url)
-    driver.find_element(
-        By.XPATH, "//a[contains(normalize-space(text()), 'Messages')]"
-    ).click()
-    driver.find_element(
-        By.XPATH,
-        "//div[2]/section/div/a/span/span",
-    ).click()
-    driver.find_element(By.ID, "message_thread_subject").send_keys(
+    click(driver, By.XPATH, "//a[contains(normalize-space(text()), 'Messages')]")
+    click(driver, By.XPATH, "//div[2]/section/div/a/span/span")
+    find(driver, By.ID, "message_thread_subject").send_keys(
         "Please complete the link(s) below"
     )
-    time.sleep(1)
-    text_field = driver.find_element(By.XPATH, "//section/div/div[3]")
+    text_field = until(
+        driver, EC.element_to_be_clickable((By.XPATH, "//section/div/div[3]"))
+    )
     text_field.click()
-    time.sleep(1)
     text_field.send_keys(message)
-    time.sleep(1)
+    # The editor takes a moment to pick up what was typed
+    until(driver, lambda driver: message.splitlines()[-1] in text_field.text)
     text_field.click()
-    driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+    click(driver, By.CSS_SELECTOR, "button[type='submit']")
 
 
-def send_asrs(driver: webdriver.Chrome, firstname: str, lastname: str):
-    log_in_ta(driver)
-    client_url = go_to_client(driver, firstname, lastname)
-    client = extract_client_data(driver, client_url)
+class Portals:
+    """TherapyAppointment and MHS, each logged into once in its own tab.
 
-    log_in_mhs(driver)
-    asrs_link = gen_asrs(driver, client)
-    if asrs_link:
-        send_message_ta(driver, client_url, asrs_link)
+    Switching tabs keeps both sessions, so any number of clients can be
+    handled without logging in again, and the sessions are saved so the next
+    run only logs in again once they've expired.
+    """
 
+    def __init__(self, driver: webdriver.Chrome):
+        self.driver = driver
+        log_in_ta(driver)
+        self._ta = driver.current_window_handle
+        driver.switch_to.new_window("tab")
+        log_in_mhs(driver)
+        self._mhs = driver.current_window_handle
 
-def send_conners(driver: webdriver.Chrome, firstname: str, lastname: str):
-    log_in_ta(driver)
+    def ta(self) -> webdriver.Chrome:
+        self.driver.switch_to.window(self._ta)
+        return self.driver
+
+    def mhs(self) -> webdriver.Chrome:
+        self.driver.switch_to.window(self._mhs)
+        return self.driver
+
+
+def send_questionnaires(
+    portals: Portals, firstname: str, lastname: str, questionnaires: list[str]
+) -> list[tuple[str, str]]:
+    """Generate the questionnaires ("asrs", "conners") for a client and send
+    them the links in one message.
+
+    Returns each link with the rater it's for.
+    """
+    driver = portals.ta()
     client_url = go_to_client(driver, firstname, lastname)
     client = extract_client_data(driver, client_url)
 
-    log_in_mhs(driver)
-    conners_link = gen_conners(driver, client)
-    if conners_link:
-        if isinstance(conners_link, list):
-            conners_link = "\n".join(conners_link)
-        send_message_ta(driver, client_url, conners_link)
+    driver = portals.mhs()
+    links = []
+    if "asrs" in questionnaires:
+        asrs_link = gen_asrs(driver, client)
+        if asrs_link:
+            links.append((asrs_link, "Parent/Guardian"))
+    if "conners" in questionnaires:
+        conners_links = gen_conners(driver, client)
+        if isinstance(conners_links, str):
+            conners_links = [conners_links]
+        # MHS lists the links in the order of the rows: parent, then self-report
+        links += zip(conners_links, ["Parent/Guardian", "Self-Report"])
 
+    if links:
+        send_message_ta(portals.ta(), client_url, "\n".join(link for link, _ in links))
+    return links
 
-# TODO:
-# - Pull names from Asana
+
+def send_asrs(driver: webdriver.Chrome, firstname: str, lastname: str):
+    return send_questionnaires(Portals(driver), firstname, lastname, ["asrs"])
+
+
+def send_conners(driver: webdriver.Chrome, firstname: str, lastname: str):
+    return send_questionnaires(Portals(driver), firstname, lastname, ["conners"])